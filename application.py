@@ -1,8 +1,104 @@
-from flask import render_template ,request,Flask
-from pipeline.prediction_pipeline import hybrid_recommendation
+import time
+from flask import render_template ,request,Flask,jsonify,g,Response
+from pipeline.prediction_pipeline import (cached_hybrid_recommendation,hybrid_recommendation_batch,
+                                          cached_model_recommendation,model_recommendation_batch)
+from utils.recommender_index import get_recommender_index, pin_recommender_index, unpin_recommender_index
+from utils.release_watcher import ensure_release_watcher
+from utils.result_cache import get_result_cache
+from utils.metrics import registry
+from config.paths_config import *
+from src.logger import get_logger
+
+# Initialize Logger
+logger = get_logger(__name__)
 
 app = Flask(__name__)
 
+serving_state = {"artifacts_loaded": False, "warmed_up": False, "model_version": None}
+
+RECOMMENDATION_MODES = ("hybrid","model")
+
+REQUESTS = registry.counter("http_requests_total", "HTTP requests served", labels=("endpoint","status"))
+REQUEST_SECONDS = registry.histogram("http_request_seconds", "HTTP request latency", labels=("endpoint",))
+CACHE_STATS = registry.gauge("recommender_cache", "Result cache hits, misses, evictions and hit rate", labels=("stat",))
+
+
+def collect_cache_stats():
+    stats = get_result_cache().stats()
+    for stat in ("hits","misses","evictions","hit_rate"):
+        CACHE_STATS.set(stat,value=stats[stat])
+
+
+registry.add_collector(collect_cache_stats)
+
+
+def recommendation_mode():
+    return get_recommender_index().config.get('serving',{}).get('recommendation_mode',"hybrid")
+
+
+def warm_up_query():
+    warm_up_user = get_recommender_index().get(USER_ENCODED2USER).get(0)
+    if recommendation_mode() == "model":
+        model_recommendation_batch([warm_up_user])
+    else:
+        hybrid_recommendation_batch([warm_up_user])
+    return warm_up_user
+
+
+def mark_ready(recommender_index):
+    serving_state.update(artifacts_loaded=True, warmed_up=True, model_version=recommender_index.version)
+
+
+def warm_up():
+    '''
+    Load every serving artifact and run one recommendation, so the first
+    real request does not pay the cold start. Under gunicorn --preload this
+    runs once in the master and the workers inherit it on fork.
+    '''
+    try:
+        recommender_index = get_recommender_index().load()
+        serving_state["artifacts_loaded"] = True
+
+        warm_up_user = warm_up_query()
+        mark_ready(recommender_index)
+        logger.info(f"Serving warm-up of release {recommender_index.version} completed with user {warm_up_user}.")
+    except Exception as e:
+        logger.exception(f"Serving warm-up failed: {e}")
+
+
+warm_up()
+
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    # New releases are loaded in the background and swapped in between requests
+    ensure_release_watcher(get_recommender_index().config.get('releases',{}).get('poll_seconds',10),
+                           warm_up=warm_up_query,on_swap=mark_ready)
+    g.recommender_index_token = pin_recommender_index()
+
+
+@app.teardown_request
+def release_request(exception=None):
+    if "recommender_index_token" in g:
+        unpin_recommender_index(g.recommender_index_token)
+
+
+@app.after_request
+def record_request(response):
+    if registry.enabled and "request_start" in g:
+        endpoint = request.endpoint or "unknown"
+        REQUESTS.inc(endpoint,response.status_code)
+        REQUEST_SECONDS.observe(endpoint,value=time.perf_counter() - g.request_start)
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    if not registry.enabled:
+        return Response("metrics disabled\n",status=404,mimetype="text/plain")
+    return Response(registry.render(),mimetype="text/plain; version=0.0.4")
+
 
 @app.route('/',methods=['GET','POST'])
 def home():
@@ -11,14 +107,117 @@ def home():
     if request.method == 'POST':
         try:
             user_id = int(request.form["userID"])
-            recommendations = hybrid_recommendation(user_id)
+            if recommendation_mode() == "model":
+                recommendations = cached_model_recommendation(user_id)["recommendations"]
+            else:
+                recommendations = cached_hybrid_recommendation(user_id)["recommendations"]
         except Exception as e:
-            print("Error occured ..........")
-    
+            logger.exception(f"Error occured while recommending for {request.form.get('userID')}: {e}")
+
     return render_template('index.html',recommendations=recommendations)
 
 
+@app.route('/ready')
+def ready():
+    # Readiness probe: artifacts are resident and a warm-up query has run
+    status = 200 if serving_state["artifacts_loaded"] and serving_state["warmed_up"] else 503
+    return jsonify(serving_state),status
+
+
+def _requested_user_ids():
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        # Valid JSON that is not an object ([1, 2], "x", 5) is a bad request, not a 500
+        if not isinstance(payload,dict):
+            raise TypeError(f"expected a JSON object, got {type(payload).__name__}")
+        user_ids = payload.get("user_ids", [payload["user_id"]] if "user_id" in payload else [])
+        if not isinstance(user_ids,list):
+            raise TypeError(f"user_ids must be a list, got {type(user_ids).__name__}")
+        options = payload
+    else:
+        user_ids = request.args.getlist("user_id")
+        options = request.args
+    return [int(user_id) for user_id in user_ids],options
+
+
+@app.route('/api/recommend',methods=['GET','POST'])
+def api_recommend():
+    '''
+    GET  /api/recommend?user_id=1&user_id=2
+    POST /api/recommend {"user_ids": [1, 2], "user_weights": 0.7, "content_weights": 0.3}
+    GET  /api/recommend?user_id=1&mode=model
+    '''
+    try:
+        user_ids,options = _requested_user_ids()
+        user_weights = float(options.get("user_weights",0.7))
+        content_weights = float(options.get("content_weights",0.3))
+        mode = options.get("mode",recommendation_mode())
+    except (KeyError,TypeError,ValueError) as e:
+        return jsonify({"error": f"Invalid request: {e}"}),400
+    if mode not in RECOMMENDATION_MODES:
+        return jsonify({"error": f"Unknown mode {mode}, expected one of {list(RECOMMENDATION_MODES)}"}),400
+
+    max_batch_size = get_recommender_index().config.get('serving',{}).get('max_batch_size',1000)
+    if not user_ids:
+        return jsonify({"error": "No user_id given"}),400
+    if len(user_ids) > max_batch_size:
+        return jsonify({"error": f"At most {max_batch_size} user ids per request"}),400
+
+    try:
+        user2user_encoded = get_recommender_index().get(USER2USER_ENCODED)
+        requested_users = list(dict.fromkeys(user_ids))
+        unknown_users = [user_id for user_id in requested_users if user_id not in user2user_encoded]
+
+        if len(requested_users) == 1:
+            if mode == "model":
+                result = cached_model_recommendation(requested_users[0])
+            else:
+                result = cached_hybrid_recommendation(requested_users[0],user_weights,content_weights)
+            recommendations = {requested_users[0]: result["recommendations"]}
+            sources = {requested_users[0]: result["source"]}
+        else:
+            if mode == "model":
+                batch = model_recommendation_batch(requested_users)
+            else:
+                batch = hybrid_recommendation_batch(requested_users,user_weights,content_weights)
+            recommendations = {user_id: [] for user_id in requested_users}
+            sources = {user_id: mode for user_id in requested_users}
+            for user_id,anime_name,source in zip(batch["user_id"].tolist(),batch["anime_name"].tolist(),batch["source"].tolist()):
+                recommendations[user_id].append(anime_name)
+                sources[user_id] = source
+
+    except Exception as e:
+        logger.exception(f"Error occured while recommending for {user_ids}: {e}")
+        return jsonify({"error": "Recommendation failed"}),500
+
+    # Unknown and sparse users are served from the popularity ranking
+    return jsonify({
+        "mode": mode,
+        "results": [{"user_id": user_id,
+                     "source": sources[user_id],
+                     "recommendations": recommendations[user_id]} for user_id in requested_users],
+        "unknown_user_ids": unknown_users,
+    })
+
+
+@app.route('/api/titles')
+def api_titles():
+    '''
+    GET /api/titles?prefix=attack%20on&limit=10
+
+    Search-as-you-type: whole-title and word prefix matches by popularity,
+    topped up with typo tolerant matches when few titles start with prefix.
+    '''
+    prefix = request.args.get("prefix","")
+    try:
+        limit = min(max(int(request.args.get("limit",10)),1),50)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {e}"}),400
+
+    titles = get_recommender_index().title_index()
+    return jsonify({"prefix": prefix, "titles": titles.titles(titles.search(prefix,limit))})
+
 if __name__ == "__main__":
-    
+
     app.run(debug=True,host='0.0.0.0',port=5000)
-    
+
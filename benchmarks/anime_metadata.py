@@ -0,0 +1,105 @@
+'''
+Scaling of DataPreprocessing.build_anime_df on synthetic raw anime.csv
+catalogues, against the per-title getAnimeName lookup it replaced.
+
+  build_anime_df  every size in --sizes (default up to 100k titles)
+  legacy          only the small --legacy-sizes, it is quadratic
+
+Per-title time staying flat as the catalogue grows is the linear scaling.
+Legacy pays two full-table filters per title, ~200x the per-title cost at
+these sizes; pandas' per-call overhead hides most of its O(n) filter term
+until catalogues well past the real ~17k titles.
+
+    python -m benchmarks.anime_metadata --sizes 12500 25000 50000 100000
+'''
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic_artifacts import GENRES, TYPES, STUDIOS
+from src.data_preprocessing import DataPreprocessing
+
+
+def synthetic_anime_csv(rng, n_titles):
+    # Raw anime.csv layout, with "Unknown" where the real file has it
+    anime_ids = np.sort(rng.choice(np.arange(1, n_titles * 4), n_titles, replace=False))
+    unknown = lambda share: rng.random(n_titles) < share
+    english = np.array([f"English title {anime_id}" for anime_id in anime_ids], dtype=object)
+    english[unknown(0.4)] = "Unknown"
+    score = np.round(rng.uniform(4, 9.2, n_titles), 2).astype(str).astype(object)
+    score[unknown(0.1)] = "Unknown"
+    genres = np.array([", ".join(rng.choice(GENRES, 2, replace=False)) for _ in range(64)], dtype=object)
+    return pd.DataFrame({
+        "MAL_ID": anime_ids,
+        "Name": [f"Romaji title {anime_id}" for anime_id in anime_ids],
+        "Score": score,
+        "Genres": genres[rng.integers(0, len(genres), n_titles)],
+        "English name": english,
+        "Type": rng.choice(TYPES + ["Unknown"], n_titles),
+        "Episodes": rng.integers(1, 64, n_titles).astype(str),
+        "Premiered": [f"Spring {year}" for year in rng.integers(1990, 2022, n_titles)],
+        "Studios": rng.choice(STUDIOS + ["Unknown"], n_titles),
+        "Members": rng.integers(100, 3_000_000, n_titles),
+    })
+
+
+def legacy_eng_version(df):
+    # What process_anime_data did before: two full-table filters per title
+    df = df.replace("Unknown", np.nan)
+
+    def anime_name(anime_id):
+        name = df[df.MAL_ID == anime_id]["English name"].values[0]
+        if name is np.nan:
+            name = df[df.MAL_ID == anime_id]["Name"].values[0]
+        return name
+
+    return df['MAL_ID'].apply(anime_name)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build_anime_df scaling on synthetic catalogues")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[12500, 25000, 50000, 100000])
+    parser.add_argument("--legacy-sizes", type=int, nargs="*", default=[2500, 5000, 10000, 20000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    processor = DataPreprocessing(input_file=None, output_dir="/tmp")
+    report = {"build_anime_df": [], "legacy": []}
+
+    for n_titles in args.sizes:
+        raw = synthetic_anime_csv(rng, n_titles)
+        anime_df, seconds = timed(processor.build_anime_df, raw)
+        report["build_anime_df"].append({
+            "titles": n_titles, "seconds": round(seconds, 4), "us_per_title": round(seconds * 1e6 / n_titles, 2),
+            "memory_mb": round(anime_df.memory_usage(index=True, deep=True).sum() / 2**20, 1),
+            "memory_mb_without_categoricals": round(anime_df.astype({column: object for column in ["Genres", "Type", "Studios"]})
+                                                    .memory_usage(index=True, deep=True).sum() / 2**20, 1),
+        })
+
+    for n_titles in args.legacy_sizes:
+        raw = synthetic_anime_csv(rng, n_titles)
+        legacy, seconds = timed(legacy_eng_version, raw)
+        anime_df = processor.build_anime_df(raw)
+        report["legacy"].append({
+            "titles": n_titles, "seconds": round(seconds, 4), "us_per_title": round(seconds * 1e6 / n_titles, 2),
+            "same_eng_version": bool(legacy.reindex(anime_df.index).astype(object).equals(anime_df["eng_version"].astype(object))),
+        })
+
+    # Per-title time of the largest over the smallest size: ~1 is linear,
+    # ~the size ratio is quadratic
+    for name, runs in report.items():
+        if len(runs) > 1:
+            report[name] = {"runs": runs, "per_title_growth": round(runs[-1]["us_per_title"] / runs[0]["us_per_title"], 2)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
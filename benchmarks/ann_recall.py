@@ -0,0 +1,73 @@
+'''
+Recall vs latency of the ann indexes against the exact brute force search
+find_similar_users does today.
+
+    python -m benchmarks.ann_recall --kind ivf --n-probe 1 2 4 8 16 --queries 500
+'''
+import argparse
+import json
+import time
+import numpy as np
+from config.paths_config import *
+from utils.ann_index import build_ann_index, search
+from utils.common_function import read_yaml
+from utils.array_store import load_array
+from utils.topk import similarity_top_k
+
+
+def recall_at_k(exact, approx):
+    hits = [len(np.intersect1d(e, a[a >= 0])) for e, a in zip(exact, approx)]
+    return float(np.sum(hits) / exact.size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall vs exact similar-user search")
+    parser.add_argument("--weights", default=USER_WEIGHTS_PATH)
+    parser.add_argument("--kind", default=None, help="ivf or lsh, defaults to config.yaml")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ann_config = dict(read_yaml(CONFIG_PATH)['ann'])
+    kind = args.kind or ann_config['kind']
+    ann_config.pop('kind')
+
+    weights = np.asarray(load_array(args.weights), dtype=np.float32)
+    rng = np.random.default_rng(args.seed)
+    queries = weights[rng.choice(len(weights), min(args.queries, len(weights)), replace=False)]
+
+    start = time.perf_counter()
+    ann_index = build_ann_index(weights, kind=kind, **ann_config)
+    build_seconds = time.perf_counter() - start
+
+    # Exact baseline, one query at a time like find_similar_users
+    start = time.perf_counter()
+    exact = np.stack([similarity_top_k(weights, query, args.k)[0][0] for query in queries])
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    results = []
+    for n_probe in args.n_probe:
+        start = time.perf_counter()
+        approx, _ = search(ann_index, queries, args.k, n_probe=n_probe)
+        approx_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        results.append({
+            "n_probe": n_probe,
+            "recall_at_k": recall_at_k(exact, approx),
+            "ms_per_query": approx_ms,
+            "speedup": exact_ms / approx_ms if approx_ms else None,
+        })
+
+    print(json.dumps({
+        "kind": kind,
+        "n_items": int(len(weights)),
+        "k": args.k,
+        "build_seconds": build_seconds,
+        "exact_ms_per_query": exact_ms,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
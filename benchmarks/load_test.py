@@ -0,0 +1,362 @@
+'''
+Throughput and tail latency of the Flask app under concurrent load.
+
+The app is driven either in process through its test client, through a
+local server this script starts (werkzeug or gunicorn), or through any
+running server given by --url. Requests are random /api/recommend calls
+over the known users, or a replayed request log (one JSON object per line,
+like requests.jsonl):
+
+    {"user_id": 11880}
+    {"user_ids": [1, 2, 3], "user_weights": 0.5, "content_weights": 0.5}
+    {"method": "GET", "path": "/ready"}
+
+Lines without a user id get a random known user, so any JSONL log can be
+replayed against synthetic artifacts. The report is a single JSON object
+(p50/p95/p99 latency, requests per second, peak RSS) meant to be diffed
+between commits.
+
+    python -m benchmarks.synthetic_artifacts --workdir /tmp/loadtest --users 20000 --anime 5000
+    python -m benchmarks.load_test --workdir /tmp/loadtest --concurrency 8 --requests 2000
+    python -m benchmarks.load_test --workdir /tmp/loadtest --server gunicorn --concurrency 32 --duration 30
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --replay access.jsonl --output report.json
+'''
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config.paths_config import *
+from utils.array_store import load_array
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Keys of a log line that describe the request rather than its body
+REQUEST_KEYS = ("method", "path", "query")
+
+
+def known_user_ids():
+    user_encoded2user = load_array(USER_ENCODED2USER)
+    return np.asarray(user_encoded2user[user_encoded2user >= 0], dtype=np.int64)
+
+
+def random_requests(rng, user_ids, batch_size):
+    while True:
+        users = rng.choice(user_ids, batch_size, replace=False).tolist()
+        if batch_size == 1:
+            yield {"method": "GET", "path": "/api/recommend", "query": {"user_id": users[0]}}
+        else:
+            yield {"method": "POST", "path": "/api/recommend", "json": {"user_ids": users}}
+
+
+def replay_requests(path, rng, user_ids):
+    '''
+    path : str : JSONL request log
+
+    yields request specs, cycling over the log
+    '''
+    with open(path) as log_file:
+        lines = [json.loads(line) for line in log_file if line.strip()]
+    if not lines:
+        raise ValueError(f"{path} holds no requests")
+
+    while True:
+        for line in lines:
+            method = line.get("method", "POST").upper()
+            request_path = line.get("path", "/api/recommend")
+            if "query" in line:
+                yield {"method": method, "path": request_path, "query": line["query"]}
+                continue
+
+            body = {key: value for key, value in line.items() if key not in REQUEST_KEYS}
+            if request_path == "/api/recommend" and "user_id" not in body and "user_ids" not in body:
+                body = {"user_id": int(rng.choice(user_ids))}
+            if method == "GET":
+                yield {"method": method, "path": request_path, "query": body}
+            else:
+                yield {"method": method, "path": request_path, "json": body}
+
+
+class ClientDriver:
+    '''
+    Sends requests through the Flask test client, in this process.
+    '''
+
+    def __init__(self):
+        start = time.perf_counter()
+        import application
+        self.startup_seconds = time.perf_counter() - start
+        self.app = application.app
+        self._local = threading.local()
+
+    def send(self, spec):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        response = self._local.client.open(spec["path"], method=spec["method"],
+                                           query_string=spec.get("query"), json=spec.get("json"))
+        response.close()
+        return response.status_code
+
+    def peak_rss_bytes(self):
+        # ru_maxrss is in KiB on Linux; includes the load generator itself
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    '''
+    Sends requests over HTTP to base_url. When server is given, starts that
+    server from the current directory first and stops it on close.
+    '''
+
+    def __init__(self, base_url=None, server=None, ready_timeout=120):
+        self.process = None
+        self.startup_seconds = None
+        if server:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            start = time.perf_counter()
+            self.process = start_server(server, port)
+            wait_until_ready(base_url, self.process, ready_timeout)
+            self.startup_seconds = time.perf_counter() - start
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, spec):
+        url = self.base_url + spec["path"]
+        if spec.get("query"):
+            url += "?" + urllib.parse.urlencode(spec["query"], doseq=True)
+        data, headers = None, {}
+        if "json" in spec:
+            data = json.dumps(spec["json"]).encode()
+            headers["Content-Type"] = "application/json"
+
+        request = urllib.request.Request(url, data=data, headers=headers, method=spec["method"])
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except (urllib.error.URLError, OSError):
+            return 0
+
+    def peak_rss_bytes(self):
+        if self.process is None:
+            return None
+        return sum(peak_rss_of(pid) for pid in process_tree(self.process.pid))
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(server, port):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_ROOT, "gunicorn.conf.py"),
+                   "--bind", f"127.0.0.1:{port}", "--access-logfile", "/dev/null", "application:app"]
+    elif server == "werkzeug":
+        command = [sys.executable, "-c",
+                   f"from application import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    else:
+        raise ValueError(f"Unknown server {server}")
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before becoming ready")
+        try:
+            with urllib.request.urlopen(base_url + "/ready", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Server at {base_url} was not ready after {timeout}s")
+
+
+def process_tree(pid):
+    # The server and its forked workers, read from /proc
+    pids = [pid]
+    # The loop also visits the children appended while it runs
+    for parent in pids:
+        try:
+            with open(f"/proc/{parent}/task/{parent}/children") as children:
+                pids.extend(int(child) for child in children.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def peak_rss_of(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def run_load(driver, requests, concurrency, n_requests=None, duration=None):
+    '''
+    driver : ClientDriver or HTTPDriver
+    requests : iterator of request specs
+    concurrency : int : requests in flight at once
+    n_requests : int : stop after this many requests
+    duration : float : or stop after this many seconds
+
+    returns (latencies in seconds, status codes, wall seconds)
+    '''
+    lock = threading.Lock()
+    latencies, statuses = [], []
+    sent = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_request():
+        with lock:
+            if n_requests is not None and sent[0] >= n_requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            sent[0] += 1
+            return next(requests)
+
+    def worker():
+        while True:
+            spec = next_request()
+            if spec is None:
+                return
+            start = time.perf_counter()
+            status = driver.send(spec)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return latencies, statuses, time.perf_counter() - start
+
+
+def summarize(latencies, statuses, wall_seconds):
+    latencies_ms = np.asarray(latencies) * 1000
+    errors = sum(1 for status in statuses if not 200 <= status < 400)
+    percentiles = np.percentile(latencies_ms, [50, 95, 99]) if len(latencies_ms) else [None] * 3
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(status): count for status, count in sorted(Counter(statuses).items())},
+        "wall_seconds": wall_seconds,
+        "requests_per_second": len(latencies) / wall_seconds if wall_seconds else None,
+        "latency_ms": {
+            "p50": float(percentiles[0]) if len(latencies_ms) else None,
+            "p95": float(percentiles[1]) if len(latencies_ms) else None,
+            "p99": float(percentiles[2]) if len(latencies_ms) else None,
+            "mean": float(latencies_ms.mean()) if len(latencies_ms) else None,
+            "max": float(latencies_ms.max()) if len(latencies_ms) else None,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the recommendation server")
+    parser.add_argument("--workdir", default=".", help="directory holding artifacts/ and config/")
+    parser.add_argument("--server", choices=["client", "werkzeug", "gunicorn"], default="client",
+                        help="test client in process, or a local server started by this script")
+    parser.add_argument("--url", default=None, help="load an already running server instead")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000, help="requests to send, ignored with --duration")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run for")
+    parser.add_argument("--warmup", type=int, default=50, help="requests sent before measuring")
+    parser.add_argument("--batch-size", type=int, default=1, help="user ids per generated request")
+    parser.add_argument("--replay", default=None, help="JSONL request log to replay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    replay = os.path.abspath(args.replay) if args.replay else None
+    output = os.path.abspath(args.output) if args.output else None
+    # Every artifact and config path is relative to the working directory
+    os.chdir(args.workdir)
+
+    rng = np.random.default_rng(args.seed)
+    user_ids = known_user_ids()
+    if replay:
+        requests = replay_requests(replay, rng, user_ids)
+    else:
+        requests = random_requests(rng, user_ids, args.batch_size)
+
+    if args.url:
+        driver = HTTPDriver(base_url=args.url)
+    elif args.server == "client":
+        driver = ClientDriver()
+    else:
+        driver = HTTPDriver(server=args.server)
+
+    try:
+        if args.warmup:
+            run_load(driver, requests, args.concurrency, n_requests=args.warmup)
+        n_requests = None if args.duration else args.requests
+        latencies, statuses, wall_seconds = run_load(driver, requests, args.concurrency,
+                                                     n_requests=n_requests, duration=args.duration)
+        peak_rss = driver.peak_rss_bytes()
+    finally:
+        driver.close()
+
+    report = {
+        "commit": git_commit(),
+        "target": args.url or args.server,
+        "concurrency": args.concurrency,
+        "batch_size": args.batch_size,
+        "replay": replay,
+        "startup_seconds": driver.startup_seconds,
+        **summarize(latencies, statuses, wall_seconds),
+        "peak_rss_mb": peak_rss / 2 ** 20 if peak_rss is not None else None,
+    }
+
+    if output:
+        with open(output, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    # Last line of stdout, after whatever the app logged
+    print(json.dumps(report))
+    sys.exit(1 if report["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
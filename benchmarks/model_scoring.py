@@ -0,0 +1,176 @@
+'''
+Latency and offline accuracy of the NumPy RecommenderNet scoring mode
+against the hybrid (similar-user voting + content) path.
+
+  parity     NumPy scores vs the Keras model on the held-out pairs (only
+             when TensorFlow and artifacts/model/model.h5 are available)
+  pointwise  RMSE / MAE of the predicted scaled ratings on the test split
+  holdout    for sampled users a share of their top rated titles is hidden
+             from both paths (preference and history indexes); hit rate and
+             recall of the hidden titles in the top-k of each path. The
+             embeddings were trained on those ratings, so both paths see
+             the same leak and only the comparison is meaningful.
+  latency    per user (single) and per batch, p50 / p95 in ms
+
+    python -m benchmarks.model_scoring --users 200 --k 10
+'''
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from config.paths_config import *
+from pipeline.prediction_pipeline import hybrid_recommendation, hybrid_recommendation_batch, model_recommendation_batch
+from utils.columnar import load_columns
+from utils.helpers import get_model_recommendations
+from utils.recommender_index import get_recommender_index, pinned_recommender_index
+
+
+def percentiles(seconds):
+    milliseconds = np.asarray(seconds) * 1000
+    return {"p50": float(np.percentile(milliseconds, 50)), "p95": float(np.percentile(milliseconds, 95))}
+
+
+def predicted_ratings(recommender_index, users, anime):
+    user_weights = np.asarray(recommender_index.user_weights[users], dtype=np.float32)
+    anime_weights = np.asarray(recommender_index.anime_weights[anime], dtype=np.float32)
+    return recommender_index.scoring_head()(np.einsum("ij,ij->i", user_weights, anime_weights))
+
+
+def keras_parity(recommender_index, users, anime):
+    try:
+        from tensorflow.keras.models import load_model
+        model = load_model(MODEL_PATH)
+    except Exception as e:
+        return {"skipped": f"{type(e).__name__}: {e}"}
+    keras_ratings = model.predict([users, anime], batch_size=10000, verbose=0).ravel()
+    numpy_ratings = predicted_ratings(recommender_index, users, anime)
+    return {"max_abs_diff": float(np.max(np.abs(keras_ratings - numpy_ratings)))}
+
+
+def holdout_index(recommender_index, sampled_users, fraction, rng):
+    '''
+    returns (derived index, {user_id: hidden anime ids}) with the hidden
+    titles removed from the preference and history indexes of sampled_users
+    '''
+    user2user_encoded = recommender_index.get(USER2USER_ENCODED)
+    anime2anime_encoded = recommender_index.get(ANIME2ANIME_ENCODED)
+    pref_offsets = np.asarray(recommender_index.get(USER_PREF_OFFSETS))
+    pref_anime = np.asarray(recommender_index.get(USER_PREF_ANIME))
+    history_offsets = np.asarray(recommender_index.get(USER_HISTORY_OFFSETS))
+    history_anime = np.asarray(recommender_index.get(USER_HISTORY_ANIME))
+
+    pref_keep = np.ones(len(pref_anime), dtype=bool)
+    history_keep = np.ones(len(history_anime), dtype=bool)
+    hidden = {}
+    for user_id in sampled_users:
+        user = user2user_encoded[user_id]
+        start, end = pref_offsets[user], pref_offsets[user + 1]
+        n_hidden = max(1, int((end - start) * fraction))
+        positions = start + rng.choice(end - start, n_hidden, replace=False)
+        pref_keep[positions] = False
+        hidden[user_id] = pref_anime[positions]
+
+        encoded = anime2anime_encoded.encode(hidden[user_id])
+        start, end = history_offsets[user], history_offsets[user + 1]
+        history_keep[start:end] &= ~np.isin(history_anime[start:end], encoded)
+
+    def compact(offsets, values, keep):
+        kept_per_row = np.add.reduceat(keep, offsets[:-1]) if len(values) else np.zeros(len(offsets) - 1, dtype=np.int64)
+        # reduceat repeats the value for empty rows, zero those
+        kept_per_row[offsets[:-1] == offsets[1:]] = 0
+        return np.concatenate(([0], np.cumsum(kept_per_row))).astype(offsets.dtype), values[keep]
+
+    pref_offsets, pref_anime = compact(pref_offsets, pref_anime, pref_keep)
+    history_offsets, history_anime = compact(history_offsets, history_anime, history_keep)
+    derived = recommender_index.derive({
+        USER_PREF_OFFSETS: pref_offsets, USER_PREF_ANIME: pref_anime,
+        USER_HISTORY_OFFSETS: history_offsets, USER_HISTORY_ANIME: history_anime,
+    })
+    return derived, hidden
+
+
+def hit_metrics(recommended, hidden):
+    hits = [len(set(recommended.get(user_id, [])) & set(hidden_ids.tolist())) for user_id, hidden_ids in hidden.items()]
+    return {
+        "hit_rate": float(np.mean([hit > 0 for hit in hits])),
+        "recall": float(np.sum(hits) / sum(len(hidden_ids) for hidden_ids in hidden.values())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy RecommenderNet scoring vs the hybrid path")
+    parser.add_argument("--users", type=int, default=200, help="users sampled for latency and holdout")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--holdout-fraction", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    recommender_index = get_recommender_index().load()
+    if not recommender_index.has_user_history():
+        sys.exit(f"{USER_HISTORY_ANIME} is missing, rerun data preprocessing")
+
+    report = {"k": args.k, "scoring_head": vars(recommender_index.scoring_head())}
+
+    # Offline, pointwise on the training holdout
+    test = load_columns(TEST_COLUMNS)
+    y_test = np.asarray(test["rating"], dtype=np.float32)
+    test_users, test_anime = np.asarray(test["user"], dtype=np.int64), np.asarray(test["anime"], dtype=np.int64)
+    errors = predicted_ratings(recommender_index, test_users, test_anime) - y_test
+    report["pointwise"] = {"pairs": len(y_test), "rmse": float(np.sqrt(np.mean(errors ** 2))),
+                           "mae": float(np.mean(np.abs(errors)))}
+    report["parity"] = keras_parity(recommender_index, test_users, test_anime)
+
+    # Users with enough top rated titles to hide some
+    encoded2user = recommender_index.get(USER_ENCODED2USER)
+    pref_counts = np.diff(np.asarray(recommender_index.get(USER_PREF_OFFSETS)))
+    candidates = np.flatnonzero(pref_counts >= 5)
+    sampled = [encoded2user[int(user)] for user in rng.choice(candidates, min(args.users, len(candidates)), replace=False)]
+
+    derived, hidden = holdout_index(recommender_index, sampled, args.holdout_fraction, rng)
+    anime_df = recommender_index.anime_df
+    name_to_id = dict(zip(anime_df['eng_version'], anime_df['MAL_ID']))
+    with pinned_recommender_index(derived):
+        model_frame = get_model_recommendations(sampled, USER_WEIGHTS_PATH, ANIME_WEIGHTS_PATH, USER2USER_ENCODED, DF, n=args.k)
+        model_recommended = model_frame.groupby("user_id")["anime_id"].apply(list).to_dict()
+        hybrid_recommended = {user_id: [name_to_id.get(name) for name in hybrid_recommendation(user_id)][:args.k]
+                              for user_id in sampled}
+    report["holdout"] = {
+        "users": len(sampled),
+        "hidden_titles": int(sum(len(hidden_ids) for hidden_ids in hidden.values())),
+        "model": hit_metrics(model_recommended, hidden),
+        "hybrid": hit_metrics(hybrid_recommended, hidden),
+    }
+
+    # Latency on the serving index, result cache bypassed
+    latency = {"model": [], "hybrid": []}
+    for user_id in sampled:
+        start = time.perf_counter()
+        model_recommendation_batch([user_id], n=args.k)
+        latency["model"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        hybrid_recommendation(user_id)
+        latency["hybrid"].append(time.perf_counter() - start)
+
+    batch = sampled[:args.batch_size]
+    start = time.perf_counter()
+    model_recommendation_batch(batch, n=args.k)
+    model_batch_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    hybrid_recommendation_batch(batch, n=args.k)
+    hybrid_batch_seconds = time.perf_counter() - start
+
+    report["latency_ms"] = {
+        "model": percentiles(latency["model"]),
+        "hybrid": percentiles(latency["hybrid"]),
+        "batch_size": len(batch),
+        "model_batch_per_user": model_batch_seconds * 1000 / len(batch),
+        "hybrid_batch_per_user": hybrid_batch_seconds * 1000 / len(batch),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+'''
+Top-k overlap, latency and memory of the float16 / int8 embedding modes
+against the float32 tables served today.
+
+    python -m benchmarks.quantization_report --weights artifacts/weights/user_weights.npy --queries 200
+'''
+import argparse
+import json
+import time
+import numpy as np
+from config.paths_config import *
+from utils.array_store import load_array
+from utils.quantization import QuantizedTable, PRECISIONS, similarity_scores
+from utils.topk import top_k
+
+
+def search(weights, queries, k):
+    # One query at a time, like find_similar_users / find_similar_animes
+    start = time.perf_counter()
+    closest = np.stack([top_k(similarity_scores(weights, query), k) for query in queries])
+    return closest, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized embedding accuracy / latency report")
+    parser.add_argument("--weights", nargs="+", default=[USER_WEIGHTS_PATH, ANIME_WEIGHTS_PATH])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = []
+    for path in args.weights:
+        weights = np.asarray(load_array(path), dtype=np.float32)
+        rng = np.random.default_rng(args.seed)
+        query_ids = rng.choice(len(weights), min(args.queries, len(weights)), replace=False)
+
+        exact, exact_ms = search(weights, weights[query_ids], args.k)
+        for precision in PRECISIONS:
+            table = weights if precision == "float32" else QuantizedTable.quantize(weights, precision)
+            # Query vectors come from the same table, as they do when serving
+            closest, ms = search(table, table[query_ids], args.k)
+            overlap = np.mean([len(np.intersect1d(e, c)) / args.k for e, c in zip(exact, closest)])
+            report.append({
+                "weights": path,
+                "precision": precision,
+                "n_items": int(len(weights)),
+                "bytes": int(table.nbytes),
+                "top_k_overlap": float(overlap),
+                "ms_per_query": ms,
+                "float32_ms_per_query": exact_ms,
+            })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+'''
+Cold start budget for the serving process, in a fresh interpreter so
+nothing is warm:
+
+  startup        import application, i.e. what gunicorn --preload does in
+                 the master: serving modules, artifact load and warm-up query
+  first_request  first /api/recommend through the test client
+
+The report lists the third party modules the server ends up importing.
+Exits non-zero if a stage exceeds its budget or a training-only module
+(TensorFlow, comet_ml, ...) is among them.
+
+    python -m benchmarks.startup_time --user-id 11880
+'''
+import sys
+import json
+import argparse
+import subprocess
+
+# Never allowed in the web process
+TRAINING_MODULES = ["tensorflow", "keras", "comet_ml", "sklearn", "google.cloud", "dvc", "joblib"]
+# Reported when loaded, the serving image installs these
+SERVING_MODULES = ["numpy", "pandas", "yaml", "flask", "sqlite3"]
+
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import application
+startup_seconds = time.perf_counter() - start
+
+client = application.app.test_client()
+start = time.perf_counter()
+response = client.get("/api/recommend", query_string={{"user_id": {user_id}}})
+first_request_seconds = time.perf_counter() - start
+
+print(json.dumps({{
+    "startup_seconds": startup_seconds,
+    "first_request_seconds": first_request_seconds,
+    "first_request_status": response.status_code,
+    "ready": application.serving_state,
+    "serving_modules_loaded": [name for name in {serving} if name in sys.modules],
+    "training_modules_loaded": [name for name in {training} if name in sys.modules],
+}}))
+'''
+
+def main():
+    parser = argparse.ArgumentParser(description="Serving cold start benchmark")
+    parser.add_argument("--user-id", type=int, required=True, help="user id for the first request")
+    parser.add_argument("--max-startup-seconds", type=float, default=30.0)
+    parser.add_argument("--max-first-request-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    probe = PROBE.format(serving=SERVING_MODULES, training=TRAINING_MODULES, user_id=args.user_id)
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+
+    failures = []
+    for stage in ("startup", "first_request"):
+        budget = getattr(args, f"max_{stage}_seconds")
+        if report[f"{stage}_seconds"] > budget:
+            failures.append(f"{stage} took {report[f'{stage}_seconds']:.3f}s, budget {budget}s")
+    if report["training_modules_loaded"]:
+        failures.append(f"training modules loaded by the server: {report['training_modules_loaded']}")
+    if report["first_request_status"] != 200:
+        failures.append(f"first request returned {report['first_request_status']}")
+
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
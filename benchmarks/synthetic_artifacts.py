@@ -0,0 +1,206 @@
+'''
+Synthetic but realistically shaped serving artifacts, written to the paths
+in config/paths_config.py relative to the current directory.
+
+  ratings     long-tailed anime popularity, users with a log-normal number
+              of ratings, ratings skewed towards 7-9
+  embeddings  clustered, L2 normalised user / anime tables (like
+              ModelTraining.extract_weights) plus the quantized copies,
+              the scoring head, the anime neighbour table and the ann indexes
+  metadata    anime_df / synopsis_df with the processed column layout, plus
+              the synopsis text stores
+
+The rating frame goes through the real DataPreprocessing steps so encoders,
+the preference index and the train/test arrays match what training writes.
+
+    python -m benchmarks.synthetic_artifacts --workdir /tmp/loadtest --users 20000 --anime 5000
+'''
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from config.paths_config import *
+from src.data_preprocessing import DataPreprocessing
+from utils.ann_index import build_ann_index, save_ann_index
+from utils.array_store import save_array
+from utils.common_function import read_yaml
+from utils.quantization import QuantizedTable, quantized_paths
+from utils.topk import neighbour_table
+
+GENRES = ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Romance", "Sci-Fi",
+          "Slice of Life", "Mystery", "Sports", "Supernatural", "Music", "Horror", "Mecha"]
+TYPES = ["TV", "Movie", "OVA", "ONA", "Special"]
+STUDIOS = ["Madhouse", "Sunrise", "Bones", "Production I.G", "Toei Animation", "Kyoto Animation", "MAPPA"]
+# Rating 1..10 distribution of the real animelist, roughly
+RATING_WEIGHTS = np.array([1, 1, 2, 3, 6, 10, 18, 24, 20, 15], dtype=np.float64)
+
+
+def prepare_workdir(workdir, overwrite=False):
+    '''
+    Creates the artifact folders under workdir and copies config.yaml next to
+    them, since every path in the repo is relative to the working directory.
+    '''
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workdir = os.path.abspath(workdir)
+    if workdir == repo_root:
+        raise ValueError("Refusing to write synthetic artifacts into the repository itself")
+    if os.path.exists(os.path.join(workdir, WEIGHTS_DIR)) and not overwrite:
+        raise FileExistsError(f"{workdir} already holds artifacts, pass --overwrite to replace them")
+
+    for directory in (PROCESSED_DIR, WEIGHTS_DIR, MODEL_DIR):
+        os.makedirs(os.path.join(workdir, directory), exist_ok=True)
+    # Only the yaml: a copied config package would shadow the repo's paths_config
+    if not os.path.exists(os.path.join(workdir, CONFIG_PATH)):
+        os.makedirs(os.path.join(workdir, os.path.dirname(CONFIG_PATH)), exist_ok=True)
+        shutil.copy(os.path.join(repo_root, CONFIG_PATH), os.path.join(workdir, CONFIG_PATH))
+    return workdir
+
+
+def synthetic_ratings(rng, n_users, n_anime, mean_ratings, anime_ids):
+    # Zipf-like popularity: a few titles collect most of the ratings
+    popularity = 1 / np.arange(1, n_anime + 1) ** 0.9
+    popularity = rng.permutation(popularity / popularity.sum())
+
+    counts = rng.lognormal(np.log(mean_ratings), 0.6, n_users).astype(np.int64)
+    counts = np.clip(counts, 5, n_anime)
+
+    user_ids, anime = [], []
+    for user, count in enumerate(counts):
+        user_ids.append(np.full(count, user, dtype=np.int64))
+        anime.append(rng.choice(n_anime, count, replace=False, p=popularity))
+
+    anime = np.concatenate(anime)
+    ratings = rng.choice(np.arange(1, 11), len(anime), p=RATING_WEIGHTS / RATING_WEIGHTS.sum())
+    return pd.DataFrame({
+        "user_id": np.concatenate(user_ids) + 1,
+        "anime_id": anime_ids[anime],
+        "rating": ratings,
+    }), popularity
+
+
+def synthetic_metadata(rng, anime_ids, popularity):
+    n_anime = len(anime_ids)
+    genres = [", ".join(rng.choice(GENRES, rng.integers(1, 4), replace=False)) for _ in range(n_anime)]
+    anime_df = pd.DataFrame({
+        "MAL_ID": anime_ids,
+        "eng_version": [f"Synthetic Anime {anime_id}" for anime_id in anime_ids],
+        "Score": np.round(rng.uniform(5, 9.2, n_anime), 2),
+        "Genres": genres,
+        "Episodes": rng.integers(1, 64, n_anime),
+        "Type": rng.choice(TYPES, n_anime),
+        "Premiered": [f"Spring {year}" for year in rng.integers(1990, 2022, n_anime)],
+        "Studios": rng.choice(STUDIOS, n_anime),
+        "Members": (popularity * 5e7).astype(np.int64) + 100,
+    }).sort_values("Score", ascending=False, kind="quicksort")
+
+    synopsis_df = pd.DataFrame({
+        "MAL_ID": anime_ids,
+        "Name": [f"Synthetic Anime {anime_id}" for anime_id in anime_ids],
+        "Genres": genres,
+        "sypnopsis": [" ".join(["A synthetic synopsis sentence."] * int(n)) for n in rng.integers(2, 12, n_anime)],
+    })
+    return anime_df, synopsis_df
+
+
+def synthetic_embeddings(rng, n_rows, dim, centers):
+    # Points around a shared set of centers so similarity search has structure
+    weights = centers[rng.integers(0, len(centers), n_rows)] + 0.5 * rng.normal(size=(n_rows, dim))
+    weights = weights / np.linalg.norm(weights, axis=1).reshape((-1, 1))
+    return weights.astype(np.float32)
+
+
+def save_weights(anime_weights, user_weights, config):
+    # Mirrors ModelTraining.save_model_weights without needing TensorFlow
+    save_array(USER_WEIGHTS_PATH, user_weights, normalized=True)
+    save_array(ANIME_WEIGHTS_PATH, anime_weights, normalized=True)
+    for path, weights in [(USER_WEIGHTS_PATH, user_weights), (ANIME_WEIGHTS_PATH, anime_weights)]:
+        for precision in ("float16", "int8"):
+            quantized = QuantizedTable.quantize(weights, precision)
+            codes_path, scales_path = quantized_paths(path, precision)
+            save_array(codes_path, quantized.codes, normalized=True)
+            if quantized.scales is not None:
+                save_array(scales_path, quantized.scales)
+
+    neighbours, similarities = neighbour_table(anime_weights, k=config['anime_neighbours']['k'],
+                                               block_rows=config['anime_neighbours']['block_rows'])
+    save_array(ANIME_NEIGHBOURS_PATH, neighbours)
+    save_array(ANIME_NEIGHBOUR_SIMILARITY_PATH, similarities)
+
+    # Dense + BatchNorm head of a trained RecommenderNet, roughly
+    with open(SCORING_HEAD_PATH, "w") as scoring_head_file:
+        json.dump({"dense_kernel": 2.5, "dense_bias": 0.1, "bn_gamma": 1.2, "bn_beta": 0.3,
+                   "bn_moving_mean": 0.4, "bn_moving_variance": 0.5, "bn_epsilon": 0.001}, scoring_head_file, indent=2)
+
+    ann_config = dict(config['ann'])
+    kind = ann_config.pop('kind')
+    save_ann_index(build_ann_index(user_weights, kind=kind, **ann_config), USER_ANN_INDEX_PATH)
+
+
+def generate(n_users=5000, n_anime=2000, mean_ratings=120, dim=128, seed=42):
+    '''
+    n_users : int : number of users
+    n_anime : int : number of anime titles
+    mean_ratings : int : median ratings per user
+    dim : int : embedding size
+    seed : int : random seed
+
+    Writes every serving artifact under the current directory and returns a
+    summary of what was generated.
+    '''
+    rng = np.random.default_rng(seed)
+    config = read_yaml(CONFIG_PATH)
+
+    anime_ids = np.sort(rng.choice(np.arange(1, n_anime * 8), n_anime, replace=False))
+    rating_df, popularity = synthetic_ratings(rng, n_users, n_anime, mean_ratings, anime_ids)
+
+    processor = DataPreprocessing(input_file=None, output_dir=PROCESSED_DIR)
+    processor.rating_df = rating_df
+    processor.scale_ratings()
+    processor.encode_data()
+    processor.build_user_preferences(percentile=75)
+    processor.build_user_history()
+    processor.split_data(test_size=min(1000, len(rating_df) // 10), random_state=seed)
+    processor.save_artifacts()
+
+    anime_df, synopsis_df = synthetic_metadata(rng, anime_ids, popularity)
+    anime_df.to_csv(DF, index=False)
+    synopsis_df.to_csv(SYNOPSIS_DF_PATH, index=False)
+    processor.save_anime_text(synopsis_df)
+    processor.save_popularity(anime_df)
+
+    centers = rng.normal(size=(32, dim))
+    # Embedding rows follow the encoders, which only cover rated anime
+    anime_weights = synthetic_embeddings(rng, len(processor.anime2anime_encoded), dim, centers)
+    user_weights = synthetic_embeddings(rng, len(processor.user2user_encoded), dim, centers)
+    save_weights(anime_weights, user_weights, config)
+
+    return {
+        "users": len(processor.user2user_encoded),
+        "anime": len(processor.anime2anime_encoded),
+        "ratings": len(rating_df),
+        "dim": dim,
+        "seed": seed,
+        "user_ids": [int(user_id) for user_id in processor.user_encoded2user.codes[:5]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic serving artifact set")
+    parser.add_argument("--workdir", required=True, help="directory the artifacts/ tree is written under")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--anime", type=int, default=2000)
+    parser.add_argument("--mean-ratings", type=int, default=120)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    os.chdir(prepare_workdir(args.workdir, args.overwrite))
+    summary = generate(args.users, args.anime, args.mean_ratings, args.dim, args.seed)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
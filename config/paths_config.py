@@ -12,25 +12,74 @@ ANIMELIST_CSV ="artifacts/raw/animelist.csv"
 ANIME_CSV ="artifacts/raw/anime.csv"
 ANIMESYNOPSIS_CSV ="artifacts/raw/anime_with_synopsis.csv"
 
-X_TRAIN_ARRAY = os.path.join(PROCESSED_DIR,"X_train.pkl")
-X_TEST_ARRAY = os.path.join(PROCESSED_DIR,"X_test.pkl")
-Y_TRAIN = os.path.join(PROCESSED_DIR,"y_train.pkl")
-Y_TEST = os.path.join(PROCESSED_DIR,"y_test.pkl")
+# Column-per-file datasets: one .npy per column plus a schema manifest
+COLUMNAR_SCHEMA = "schema.json"
+# user / anime (encoded) and rating (scaled) of the train and test split
+TRAIN_COLUMNS = os.path.join(PROCESSED_DIR,"train")
+TEST_COLUMNS = os.path.join(PROCESSED_DIR,"test")
+# Shuffled rating_df (user_id, anime_id, rating, user, anime)
+RATING_COLUMNS = os.path.join(PROCESSED_DIR,"ratings")
 
+# Still the key the helpers use for rating_df, read from RATING_COLUMNS when
+# present; the csv itself is only written with data_preprocessing.export_csv
 RATING_DF = os.path.join(PROCESSED_DIR,"rating_df.csv")
 DF = os.path.join(PROCESSED_DIR,"anime_df.csv")
 SYNOPSIS_DF_PATH = os.path.join(PROCESSED_DIR,"synopsis_df.csv")
+# synopsis_df columns served from memory-mapped UTF-8 blobs, each with an int64
+# <name>_offsets.npy next to it; row i belongs to the i-th of the ascending MAL_IDs
+# in ANIME_TEXT_IDS (every synopsis_df title, rated or not)
+ANIME_TEXT_IDS = os.path.join(PROCESSED_DIR,"anime_text_ids.npy")
+ANIME_NAME_TEXT = os.path.join(PROCESSED_DIR,"anime_name.bin")
+ANIME_GENRES_TEXT = os.path.join(PROCESSED_DIR,"anime_genres.bin")
+ANIME_SYNOPSIS_TEXT = os.path.join(PROCESSED_DIR,"anime_synopsis.bin")
+# Weighted Score / Members ranking, overall and per genre, for cold-start users
+POPULARITY_PATH = os.path.join(PROCESSED_DIR,"popularity.json")
 
-USER2USER_ENCODED = os.path.join(PROCESSED_DIR,"user2user_encoded.pkl")
-USER_ENCODED2USER = os.path.join(PROCESSED_DIR,"user_encoded2user.pkl")
-ANIME2ANIME_ENCODED = os.path.join(PROCESSED_DIR,"anime2anime_encoded.pkl")
-ANIME_ENCODED2ANIME = os.path.join(PROCESSED_DIR,"anime_encoded2anime.pkl")
+# Encoders are dense int32 arrays (-1 = unknown id), weights raw float32,
+# each with a small json header next to the .npy
+USER2USER_ENCODED = os.path.join(PROCESSED_DIR,"user2user_encoded.npy")
+USER_ENCODED2USER = os.path.join(PROCESSED_DIR,"user_encoded2user.npy")
+ANIME2ANIME_ENCODED = os.path.join(PROCESSED_DIR,"anime2anime_encoded.npy")
+ANIME_ENCODED2ANIME = os.path.join(PROCESSED_DIR,"anime_encoded2anime.npy")
+
+# Per-user top rated anime in CSR layout (row = encoded user)
+USER_PREF_OFFSETS = os.path.join(PROCESSED_DIR,"user_pref_offsets.npy")
+USER_PREF_ANIME = os.path.join(PROCESSED_DIR,"user_pref_anime.npy")
+
+# Every anime each user rated (encoded ids, CSR layout), masked out when scoring the catalogue
+USER_HISTORY_OFFSETS = os.path.join(PROCESSED_DIR,"user_history_offsets.npy")
+USER_HISTORY_ANIME = os.path.join(PROCESSED_DIR,"user_history_anime.npy")
 
 ###################### MODEL TRAINING #############################
 
 MODEL_DIR = "artifacts/model"
 WEIGHTS_DIR = "artifacts/weights"
 MODEL_PATH = os.path.join(MODEL_DIR,"model.h5")
-ANIME_WEIGHTS_PATH = os.path.join(WEIGHTS_DIR,"anime_weights.pkl")
-USER_WEIGHTS_PATH = os.path.join(WEIGHTS_DIR,"user_weights.pkl")
-CHECKPOINT_FILE_PATH = "artifacts/model_checkpoint/weights.weights.h5"
\ No newline at end of file
+ANIME_WEIGHTS_PATH = os.path.join(WEIGHTS_DIR,"anime_weights.npy")
+USER_WEIGHTS_PATH = os.path.join(WEIGHTS_DIR,"user_weights.npy")
+USER_ANN_INDEX_PATH = os.path.join(WEIGHTS_DIR,"user_ann_index.npz")
+ANIME_NEIGHBOURS_PATH = os.path.join(WEIGHTS_DIR,"anime_neighbours.npy")
+ANIME_NEIGHBOUR_SIMILARITY_PATH = os.path.join(WEIGHTS_DIR,"anime_neighbour_similarity.npy")
+# Dense + BatchNorm parameters on top of the embedding dot product, for NumPy scoring
+SCORING_HEAD_PATH = os.path.join(WEIGHTS_DIR,"scoring_head.json")
+CHECKPOINT_FILE_PATH = "artifacts/model_checkpoint/weights.weights.h5"
+
+###################### TRAINING PIPELINE #############################
+
+# Fingerprint of the last successful run of each stage, see utils/stage_cache.py
+STAGE_CACHE_DIR = "artifacts/stages"
+
+###################### ARTIFACT RELEASES #############################
+
+# Training publishes immutable copies of the serving artifacts to
+# releases/<version>/ (same processed/, weights/, model/ layout) and
+# CURRENT names the version the servers should load.
+ARTIFACTS_DIR = "artifacts"
+RELEASES_DIR = os.path.join(ARTIFACTS_DIR,"releases")
+CURRENT_RELEASE = os.path.join(RELEASES_DIR,"CURRENT")
+RELEASE_MANIFEST = "manifest.json"
+
+###################### SERVING #############################
+
+CACHE_DIR = "artifacts/cache"
+RESULT_CACHE_PATH = os.path.join(CACHE_DIR,"recommendations.sqlite")
@@ -0,0 +1,14 @@
+# Production server: gunicorn -c gunicorn.conf.py application:app
+#
+# preload_app imports application.py (artifact load + warm-up) once in the
+# master before forking, so every worker shares the same memory-mapped
+# artifacts instead of loading its own copy.
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("WEB_THREADS", "2"))
+preload_app = True
+timeout = int(os.environ.get("WEB_TIMEOUT", "60"))
+accesslog = "-"
@@ -1,10 +1,102 @@
+import time
+from concurrent.futures import wait, TimeoutError as FuturesTimeoutError
 from config.paths_config import * 
 from utils.helpers import *
+from utils.result_cache import get_result_cache
+from utils.concurrency import get_executor, remaining
+from utils.metrics import timed
+from src.logger import get_logger
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+
+class PartialRecommendations(list):
+    '''
+    Recommendations cut short by the request deadline; never cached.
+    '''
+    partial = True
+
+
+class RecommendationResult(dict):
+    '''
+    {"source": "hybrid" | "model" | "popularity", "recommendations": titles},
+    what the single-user calls return so callers never redo the cold-start
+    check. Partial (and never cached) when the titles were cut short.
+    '''
+
+    def __init__(self,source,recommendations):
+        super().__init__(source=source,recommendations=recommendations)
+        self.partial = getattr(recommendations,"partial",False)
+
+
+def combine_recommendations(user_recommended_animes_list,content_recommended_animes,
+                            user_weights=0.7,content_weights=0.3,n=10):
+    combine_scores = {}
+    for anime in user_recommended_animes_list:
+        combine_scores[anime] = combine_scores.get(anime, 0) + user_weights
+    for anime in content_recommended_animes:
+        combine_scores[anime] = combine_scores.get(anime, 0) + content_weights
+    
+    sorted_animes = sorted(combine_scores.items(), key=lambda x: x[1], reverse=True)
+    
+    return sorted_animes[:n]
+
+def use_popularity_fallback(user_id):
+    min_ratings = get_recommender_index().config.get('popularity',{}).get('min_user_ratings',5)
+    return is_cold_start_user(user_id,USER2USER_ENCODED,min_ratings)
+
+
+def popularity_recommendation(user_id,n=10):
+    return get_popular_animes(user_id,USER2USER_ENCODED,DF,n=n)['anime_name'].tolist()
+
+
+def popularity_recommendation_batch(user_ids,n=10):
+    '''
+    returns pd.DataFrame : columns user_id, rank, anime_id, anime_name, score, source
+    '''
+    frames = []
+    for user_id in user_ids:
+        popular = get_popular_animes(user_id,USER2USER_ENCODED,DF,n=n)
+        frames.append(popular.assign(user_id=user_id,rank=np.arange(1,len(popular) + 1),source="popularity"))
+    columns = ["user_id","rank","anime_id","anime_name","score","source"]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames,ignore_index=True)[columns]
+
+
+def _with_popularity_fallback(frame,fallback_users,user_ids,n=10):
+    '''
+    frame : pd.DataFrame : rows of every distinct scored user, in rank order per user
+
+    Adds popularity rows for cold-start users, then fans the rows back out
+    to one block per requested id, in request order (repeated ids repeat).
+    '''
+    if fallback_users:
+        fallback = popularity_recommendation_batch(fallback_users,n)[list(frame.columns)]
+        frame = pd.concat([frame,fallback],ignore_index=True) if len(frame) else fallback
+    rows_by_user = frame.groupby('user_id',sort=False).indices
+    blocks = [rows_by_user[user_id] for user_id in user_ids if user_id in rows_by_user]
+    if not blocks:
+        return frame.iloc[0:0].reset_index(drop=True)
+    return frame.iloc[np.concatenate(blocks)].reset_index(drop=True)
 
 
 def hybrid_recommendation(user_id,user_weights=0.7,content_weights=0.3):
+    return hybrid_recommendation_result(user_id,user_weights,content_weights)["recommendations"]
+
+
+@timed("hybrid_recommendation")
+def hybrid_recommendation_result(user_id,user_weights=0.7,content_weights=0.3):
+    # Cold start is decided from the encoder alone, before any similarity search
+    if use_popularity_fallback(user_id):
+        return RecommendationResult("popularity",popularity_recommendation(user_id))
+
+    if get_recommender_index().config.get('concurrency',{}).get('enabled'):
+        return RecommendationResult("hybrid",concurrent_hybrid_recommendation(user_id,user_weights,content_weights))
+
     # Get similar users
-    similar_users_ = find_similar_users(5964,USER_WEIGHTS_PATH,USER2USER_ENCODED,
+    similar_users_ = find_similar_users(user_id,USER_WEIGHTS_PATH,USER2USER_ENCODED,
                      USER_ENCODED2USER,n=10)
 #                     find_similar_users(5964,USER_WEIGHTS_PATH,USER2USER_ENCODED,
 # #                        USER_ENCODED2USER,n=10,return_dist=False,neg=False)
@@ -23,21 +115,211 @@ def hybrid_recommendation(user_id,user_weights=0.7,content_weights=0.3):
     
     # Get content-based recommendations
     content_recommended_animes = []
-    for anime in user_recommended_animes_list:
-        similar_animes = find_similar_animes(anime,ANIME_WEIGHTS_PATH,ANIME2ANIME_ENCODED,
-                                            ANIME_ENCODED2ANIME,DF,n=5,return_dist=False,neg=False)
+    similar_animes_list = find_similar_animes_batch(user_recommended_animes_list,ANIME_WEIGHTS_PATH,
+                                                    ANIME2ANIME_ENCODED,ANIME_ENCODED2ANIME,DF,n=5,neg=False)
+    for anime,similar_animes in zip(user_recommended_animes_list,similar_animes_list):
         if similar_animes is not None and not similar_animes.empty:
             content_recommended_animes.extend(similar_animes['anime_name'].tolist())
         else:
             print(f"No similar animes found for {anime}")
         
     
-    combine_scores = {}
-    for anime in user_recommended_animes_list:
-        combine_scores[anime] = combine_scores.get(anime, 0) + user_weights
-    for anime in content_recommended_animes:
-        combine_scores[anime] = combine_scores.get(anime, 0) + content_weights
+    sorted_animes = combine_recommendations(user_recommended_animes_list,content_recommended_animes,
+                                            user_weights,content_weights)
     
-    sorted_animes = sorted(combine_scores.items(), key=lambda x: x[1], reverse=True)
-    
-    return [anime for anime,score in sorted_animes[:10]]
+    return RecommendationResult("hybrid",[anime for anime,score in sorted_animes])
+
+
+@timed("concurrent_hybrid_recommendation")
+def concurrent_hybrid_recommendation(user_id,user_weights=0.7,content_weights=0.3,timeout=None):
+    '''
+    hybrid_recommendation with the independent stages on the shared thread
+    pool: similar users and user preferences run side by side, and the
+    content lookup runs as a few batched chunks of the recommended titles
+    (one matrix product each).
+
+    timeout : float : request deadline in seconds (concurrency.request_timeout_seconds
+    by default). Stages that have not finished by the deadline are cancelled
+    if they have not started, and a PartialRecommendations is returned.
+    Tasks wait for one of concurrency.max_in_flight pool slots, at most
+    until the deadline.
+    '''
+    concurrency_config = get_recommender_index().config.get('concurrency',{})
+    if timeout is None:
+        timeout = concurrency_config.get('request_timeout_seconds',2.0)
+    deadline = time.monotonic() + timeout
+    max_workers = concurrency_config.get('max_workers',4)
+    executor = get_executor(max_workers,concurrency_config.get('max_in_flight'))
+
+    collaborative_futures = [
+        executor.submit_before(deadline,find_similar_users,user_id,USER_WEIGHTS_PATH,USER2USER_ENCODED,
+                               USER_ENCODED2USER,n=10),
+        executor.submit_before(deadline,get_user_preferences,user_id,RATING_DF,DF),
+    ]
+    try:
+        if None in collaborative_futures:
+            raise FuturesTimeoutError()
+        similar_users_,user_preferences = [future.result(timeout=remaining(deadline)) for future in collaborative_futures]
+    except FuturesTimeoutError:
+        # Queued stages give their pool slot back instead of running for nobody
+        for future in collaborative_futures:
+            if future is not None:
+                future.cancel()
+        logger.warning(f"Collaborative stage for user {user_id} missed the {timeout}s deadline.")
+        return PartialRecommendations()
+
+    recommendations = get_user_recommendations(similar_users_,user_preferences,DF,SYNOPSIS_DF_PATH,RATING_DF,n=10)
+    user_recommended_animes_list = recommendations['anime_name'].tolist()
+
+    # A few chunks of titles, each scored with one matrix product
+    n_chunks = min(max_workers,len(user_recommended_animes_list))
+    chunks = [user_recommended_animes_list[position::n_chunks] for position in range(n_chunks)]
+    content_futures = [
+        executor.submit_before(deadline,find_similar_animes_batch,chunk,ANIME_WEIGHTS_PATH,ANIME2ANIME_ENCODED,
+                               ANIME_ENCODED2ANIME,DF,n=5,neg=False)
+        for chunk in chunks
+    ]
+    submitted = [future for future in content_futures if future is not None]
+    done,not_done = wait(submitted,timeout=remaining(deadline))
+    for future in not_done:
+        future.cancel()
+
+    similar_by_title = {}
+    for chunk,future in zip(chunks,content_futures):
+        if future in done and future.exception() is None:
+            similar_by_title.update(zip(chunk,future.result()))
+
+    # Keep the title order so results match the serial path when nothing times out
+    content_recommended_animes = []
+    for anime in user_recommended_animes_list:
+        similar_animes = similar_by_title.get(anime)
+        if similar_animes is not None and not similar_animes.empty:
+            content_recommended_animes.extend(similar_animes['anime_name'].tolist())
+
+    sorted_animes = combine_recommendations(user_recommended_animes_list,content_recommended_animes,
+                                            user_weights,content_weights)
+    result = [anime for anime,score in sorted_animes]
+
+    if not_done or len(submitted) < len(content_futures):
+        missed = len(not_done) + len(content_futures) - len(submitted)
+        logger.warning(f"{missed} of {len(chunks)} content chunks for user {user_id} missed the {timeout}s deadline.")
+        return PartialRecommendations(result)
+    return result
+
+
+def cached_hybrid_recommendation(user_id,user_weights=0.7,content_weights=0.3):
+    '''
+    hybrid_recommendation_result behind the configured result cache. Entries
+    are keyed on the request and the current artifacts version.
+
+    returns dict : source and recommendations
+    '''
+    return get_result_cache().get_or_compute(
+        ("hybrid_result",user_id,user_weights,content_weights),
+        lambda: hybrid_recommendation_result(user_id,user_weights,content_weights),
+    )
+
+
+@timed("hybrid_recommendation_batch")
+def hybrid_recommendation_batch(user_ids,user_weights=0.7,content_weights=0.3,n=10):
+    '''
+    user_ids : list : raw user ids
+
+    Same recommendations as hybrid_recommendation for many users at once.
+    Similar users for every user come from one matrix product, similar-user
+    preferences and content neighbours are looked up once per batch.
+
+    returns pd.DataFrame : columns user_id, rank, anime_name, score, source
+    (unknown and sparse users get popularity rows)
+    '''
+    recommender_index = get_recommender_index()
+    encoded2user = recommender_index.get(USER_ENCODED2USER)
+    weights = recommender_index.user_weights
+
+    # Repeated ids are scored once and fanned back out at the end
+    distinct_users = list(dict.fromkeys(user_ids))
+    fallback_users = [user_id for user_id in distinct_users if use_popularity_fallback(user_id)]
+    cold_start = set(fallback_users)
+    known_users = [user_id for user_id in distinct_users if user_id not in cold_start]
+    user2user_encoded = recommender_index.get(USER2USER_ENCODED)
+    columns = {"user_id": [], "rank": [], "anime_name": [], "score": [], "source": []}
+    if not known_users:
+        return _with_popularity_fallback(pd.DataFrame(columns),fallback_users,user_ids,n)
+
+    encoded_users = [user2user_encoded[user_id] for user_id in known_users]
+    closest,similarities = similarity_top_k(weights,weights[encoded_users],10)
+
+    # Collaborative stage, sharing similar-user preference lookups
+    preference_rows = {}
+    user_recommended = {}
+    for user_id,user_closest,user_similarities in zip(known_users,closest,similarities):
+        similar_users_ = pd.DataFrame({
+            "similiar_users": [encoded2user.get(close) for close in user_closest],
+            "similarity": user_similarities,
+        })
+        similar_users_ = similar_users_[similar_users_.similiar_users != user_id]
+
+        user_preferences = get_user_preferences(user_id,RATING_DF,DF)
+        recommendations = get_user_recommendations(similar_users_,user_preferences,DF,SYNOPSIS_DF_PATH,
+                                                   RATING_DF,n=10,preference_rows=preference_rows)
+        user_recommended[user_id] = recommendations['anime_name'].tolist()
+
+    # Content stage, one query per distinct title across the whole batch
+    titles = list(dict.fromkeys(anime for animes in user_recommended.values() for anime in animes))
+    similar_animes_list = find_similar_animes_batch(titles,ANIME_WEIGHTS_PATH,ANIME2ANIME_ENCODED,
+                                                    ANIME_ENCODED2ANIME,DF,n=5,neg=False)
+    content_neighbours = {
+        anime: similar_animes['anime_name'].tolist() if similar_animes is not None else []
+        for anime,similar_animes in zip(titles,similar_animes_list)
+    }
+
+    for user_id in known_users:
+        user_recommended_animes_list = user_recommended[user_id]
+        content_recommended_animes = [similar for anime in user_recommended_animes_list
+                                      for similar in content_neighbours[anime]]
+        sorted_animes = combine_recommendations(user_recommended_animes_list,content_recommended_animes,
+                                                user_weights,content_weights,n=n)
+        for rank,(anime,score) in enumerate(sorted_animes,start=1):
+            columns["user_id"].append(user_id)
+            columns["rank"].append(rank)
+            columns["anime_name"].append(anime)
+            columns["score"].append(score)
+            columns["source"].append("hybrid")
+
+    return _with_popularity_fallback(pd.DataFrame(columns),fallback_users,user_ids,n)
+
+
+@timed("model_recommendation_batch")
+def model_recommendation_batch(user_ids,n=10):
+    '''
+    Whole-catalogue RecommenderNet scores instead of similar-user voting.
+
+    returns pd.DataFrame : columns user_id, rank, anime_id, anime_name, score, source
+    (unknown and sparse users get popularity rows)
+    '''
+    distinct_users = list(dict.fromkeys(user_ids))
+    fallback_users = [user_id for user_id in distinct_users if use_popularity_fallback(user_id)]
+    cold_start = set(fallback_users)
+    model_users = [user_id for user_id in distinct_users if user_id not in cold_start]
+    recommendations = get_model_recommendations(model_users,USER_WEIGHTS_PATH,ANIME_WEIGHTS_PATH,USER2USER_ENCODED,DF,n=n)
+    return _with_popularity_fallback(recommendations.assign(source="model"),fallback_users,user_ids,n)
+
+
+def model_recommendation(user_id,n=10):
+    return model_recommendation_result(user_id,n)["recommendations"]
+
+
+def model_recommendation_result(user_id,n=10):
+    batch = model_recommendation_batch([user_id],n=n)
+    source = batch['source'].iloc[0] if len(batch) else "model"
+    return RecommendationResult(source,batch['anime_name'].tolist())
+
+
+def cached_model_recommendation(user_id,n=10):
+    '''
+    returns dict : source and recommendations
+    '''
+    return get_result_cache().get_or_compute(
+        ("model_result",user_id,n),
+        lambda: model_recommendation_result(user_id,n),
+    )
@@ -1,17 +1,56 @@
+import argparse
 from utils.common_function import read_yaml
+from utils.artifact_store import publish_release, current_release
+from utils.stage_cache import Stage, run_stage
 from config.paths_config import *
-from src.data_preprocessing import DataPreprocessing
-from src.model_training import ModelTraining
 
+# Each stage reruns only when its inputs, config sections or code changed
+PREPROCESS = Stage("preprocess",
+                   inputs=[ANIMELIST_CSV,ANIME_CSV,ANIMESYNOPSIS_CSV],
+                   outputs=[PROCESSED_DIR],
+                   config_keys=["data_preprocessing","popularity"],
+                   code=["src.data_preprocessing","utils.popularity","utils.text_store","utils.columnar","utils.array_store"])
 
+TRAIN = Stage("train",
+              inputs=[TRAIN_COLUMNS,TEST_COLUMNS,USER_ENCODED2USER,ANIME_ENCODED2ANIME],
+              outputs=[MODEL_PATH,WEIGHTS_DIR],
+              config_keys=["model","anime_neighbours","ann"],
+              code=["src.model_training","src.base_model","utils.ann_index","utils.quantization","utils.topk","utils.array_store"])
+
+STAGES = {"preprocess": PREPROCESS, "train": TRAIN}
+
+
+def run_preprocess():
+    # Imported here so a skipped stage never loads its dependencies
+    from src.data_preprocessing import DataPreprocessing
+    data_preprocessor = DataPreprocessing(input_file=ANIMELIST_CSV,output_dir=PROCESSED_DIR)
+    data_preprocessor.run()
+
+
+def run_train():
+    from src.model_training import ModelTraining
+    model_trainer = ModelTraining(PROCESSED_DIR)
+    model_trainer.train_model()
 
 
 if __name__ == "__main__":
-        
-        # Instantiate and run the Data Preprocessing 
-        data_preprocessor = DataPreprocessing(input_file=ANIMELIST_CSV,output_dir=PROCESSED_DIR)
-        data_preprocessor.run()
-
-        # Instantiate and run the Model Training
-        model_trainer = ModelTraining(PROCESSED_DIR)
-        model_trainer.train_model()
\ No newline at end of file
+
+        parser = argparse.ArgumentParser(description="Preprocess, train and publish a release, skipping up to date stages")
+        parser.add_argument("--force",nargs="+",default=[],choices=list(STAGES) + ["all"],
+                            help="stages to rerun even when their inputs did not change")
+        parser.add_argument("--no-publish",action="store_true",
+                            help="only refresh the working artifacts, e.g. when the image build ships them")
+        args = parser.parse_args()
+        forced = set(STAGES) if "all" in args.force else set(args.force)
+
+        config = read_yaml(CONFIG_PATH)
+        hash_inputs = config.get('training_pipeline',{}).get('hash_inputs',False)
+
+        # Run the Data Preprocessing, then the Model Training on its outputs
+        ran = [run_stage(STAGES[name],run,config,force=name in forced,hash_inputs=hash_inputs)
+               for name,run in [("preprocess",run_preprocess),("train",run_train)]]
+
+        # Publish the artifacts as a new immutable release, running servers pick it up from releases/CURRENT
+        if not args.no_publish and (any(ran) or current_release() is None):
+            releases_config = config.get('releases',{})
+            publish_release(keep=releases_config.get('keep',5))
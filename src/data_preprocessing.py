@@ -1,16 +1,38 @@
 import os 
 import pandas as pd 
 import numpy as np 
-import joblib 
+import json
+import time
+from contextlib import contextmanager
 from sklearn.model_selection import train_test_split
 from src.logger import get_logger
 from src.custom_exception import CustomException, DataValidationError
+from utils.array_store import save_array, dense_lookup, DenseEncoder
+from utils.common_function import read_yaml
+from utils.popularity import popularity_ranking
+from utils.text_store import save_text
+from utils.columnar import save_columns
 from config.paths_config import *
 import sys
 
 # Initialize Logger 
 logger = get_logger(__name__)
 
+# Compact column types for animelist.csv, half the pandas int64 / float64 defaults
+RATING_DTYPES = {'user_id': np.int32, 'anime_id': np.int32, 'rating': np.float32}
+# Few distinct values repeated across titles, kept as pandas categoricals
+ANIME_CATEGORICAL_COLUMNS = ["Genres","Type","Studios"]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,1)
+
 class DataPreprocessing:
     def __init__(self, input_file,output_dir):
 
@@ -29,15 +51,44 @@ class DataPreprocessing:
         self.y_train = None
         self.y_test = None
 
-        self.user2user_encoded = {}
-        self.user_encoded2user = {}
-        self.anime2anime_encoded = {}
-        self.anime_encoded2anime = {}
+        # Dense int32 id arrays behind a dict-like view, see encode_data
+        self.user2user_encoded = DenseEncoder(np.zeros(0,dtype=np.int32))
+        self.user_encoded2user = DenseEncoder(np.zeros(0,dtype=np.int32))
+        self.anime2anime_encoded = DenseEncoder(np.zeros(0,dtype=np.int32))
+        self.anime_encoded2anime = DenseEncoder(np.zeros(0,dtype=np.int32))
+
+        self.user_pref_offsets = None
+        self.user_pref_anime = None
+
+        self.user_history_offsets = None
+        self.user_history_anime = None
+
+        self.stage_report = []
 
         os.makedirs(self.output_dir,exist_ok=True)
         logger.info(f"Data Preprocessing initialized. Input file: {self.input_file}, Output dir: {self.output_dir}")
 
     
+    @contextmanager
+    def stage(self,name):
+        '''
+        Times a preprocessing step and records the rating df size and the
+        process peak RSS after it, for the report logged at the end of run.
+        '''
+        start = time.perf_counter()
+        yield
+        rating_df_mb = self.rating_df.memory_usage(index=True).sum() / 2**20 if self.rating_df is not None else 0.0
+        entry = {"stage": name, "seconds": round(time.perf_counter() - start,3),
+                 "rating_df_mb": round(float(rating_df_mb),1), "peak_rss_mb": peak_rss_mb()}
+        self.stage_report.append(entry)
+        logger.info(f"Stage {name}: {entry['seconds']}s, rating df {entry['rating_df_mb']} MB, peak RSS {entry['peak_rss_mb']} MB")
+
+    def log_stage_report(self):
+        lines = [f"{'stage':<24}{'seconds':>10}{'rating_df_mb':>14}{'peak_rss_mb':>13}"]
+        for entry in self.stage_report:
+            lines.append(f"{entry['stage']:<24}{entry['seconds']:>10}{entry['rating_df_mb']:>14}{str(entry['peak_rss_mb']):>13}")
+        logger.info("Data Preprocessing memory and time report:\n" + "\n".join(lines))
+
     def load_data(self):
         try:
             self.rating_df = pd.read_csv(self.input_file,low_memory=True,usecols=['user_id','anime_id','rating'])
@@ -47,10 +98,57 @@ class DataPreprocessing:
             raise CustomException(f"Error loading data from {self.input_file}: {e}", "Data Loading")
         
     
+    def load_data_chunked(self,min_ratings=400,chunk_rows=5000000):
+        '''
+        min_ratings : int : users with fewer ratings are dropped
+        chunk_rows : int : csv rows held in memory at a time
+
+        Out-of-core load_data + filter_users in two passes over the csv:
+          1. count ratings per user, one chunk of user ids at a time
+          2. copy the rows of users with enough ratings into columns
+             preallocated at their exact final length
+        Peak memory is the filtered columns plus one chunk, never the whole
+        raw file. Row order matches load_data + filter_users.
+        '''
+        try:
+            counts = np.zeros(0,dtype=np.int64)
+            for chunk in pd.read_csv(self.input_file,usecols=['user_id'],dtype={'user_id': np.int32},chunksize=chunk_rows):
+                chunk_counts = np.bincount(chunk['user_id'].to_numpy())
+                if len(chunk_counts) > len(counts):
+                    counts = np.pad(counts,(0,len(chunk_counts) - len(counts)))
+                counts[:len(chunk_counts)] += chunk_counts
+
+            keep_user = counts >= min_ratings
+            n_rows = int(counts[keep_user].sum())
+            columns = {column: np.empty(n_rows,dtype=dtype) for column,dtype in RATING_DTYPES.items()}
+
+            position = 0
+            for chunk in pd.read_csv(self.input_file,usecols=list(RATING_DTYPES),dtype=RATING_DTYPES,chunksize=chunk_rows):
+                user_ids = chunk['user_id'].to_numpy()
+                if len(user_ids) and user_ids.max() >= len(keep_user):
+                    raise DataValidationError(f"{self.input_file} changed between the two passes")
+                keep = keep_user[user_ids]
+                n_kept = int(np.count_nonzero(keep))
+                if position + n_kept > n_rows:
+                    raise DataValidationError(f"{self.input_file} changed between the two passes")
+                for column,values in columns.items():
+                    values[position:position + n_kept] = chunk[column].to_numpy()[keep]
+                position += n_kept
+
+            if position != n_rows:
+                raise DataValidationError(f"{self.input_file} changed between the two passes")
+
+            self.rating_df = pd.DataFrame(columns,copy=False)
+            logger.info(f"Loaded {n_rows} ratings of {int(keep_user.sum())} users with at least {min_ratings} ratings "
+                        f"from {self.input_file} in chunks of {chunk_rows} rows ({int(counts.sum())} rows read).")
+        except Exception as e:
+            logger.error(f"Error loading data in chunks from {self.input_file}: {e}")
+            raise CustomException(f"Error loading data in chunks from {self.input_file}: {e}", "Chunked Data Loading")
+
     def filter_users(self,min_ratings=400):
         try:
             n_ratings = self.rating_df['user_id'].value_counts()
-            self.rating_df = self.rating_df[self.rating_df['user_id'].isin(n_ratings[n_ratings >= 400].index)].copy()
+            self.rating_df = self.rating_df[self.rating_df['user_id'].isin(n_ratings[n_ratings >= min_ratings].index)].copy()
             logger.info(f"Filtered users with at least {min_ratings} ratings. New shape: {self.rating_df.shape}")
         except Exception as e:
             logger.error(f"Error filtering users: {e}")
@@ -58,9 +156,10 @@ class DataPreprocessing:
         
     def scale_ratings(self):
         try:
-            min_rating = self.rating_df['rating'].min()
-            max_rating = self.rating_df['rating'].max()
-            self.rating_df['rating'] = self.rating_df['rating'].apply(lambda x: (x-min_rating)/(max_rating - min_rating)).values.astype(np.float64)
+            ratings = self.rating_df['rating'].to_numpy(dtype=np.float32)
+            min_rating = ratings.min()
+            max_rating = ratings.max()
+            self.rating_df['rating'] = (ratings - min_rating) / (max_rating - min_rating)
             logger.info(f"Scaled ratings to range [0, 1].")
         except Exception as e:
             logger.error(f"Error scaling ratings: {e}")
@@ -68,33 +167,86 @@ class DataPreprocessing:
         
     def encode_data(self):
         try:
-            # users and Anime ids encoding 
+            # factorize keeps first appearance order, so codes match the old
+            # enumerate(unique()) dicts; int32 codes and id arrays directly
+            user_codes,user_ids = pd.factorize(self.rating_df['user_id'],sort=False)
+            anime_codes,anime_ids = pd.factorize(self.rating_df['anime_id'],sort=False)
 
-            user_ids = self.rating_df['user_id'].unique().tolist()
-            anime_ids = self.rating_df['anime_id'].unique().tolist()
+            # Encode / decode user ids
+            self.user2user_encoded = DenseEncoder(dense_lookup(user_ids))
+            self.user_encoded2user = DenseEncoder(np.asarray(user_ids,dtype=np.int32))
 
-            # Encode user ids 
-            self.user2user_encoded = { x:i for i,x in enumerate(user_ids)}
+            # Encode / decode anime ids
+            self.anime2anime_encoded = DenseEncoder(dense_lookup(anime_ids))
+            self.anime_encoded2anime = DenseEncoder(np.asarray(anime_ids,dtype=np.int32))
 
-            # Encode anime ids
-            self.anime2anime_encoded = {x:i for i,x in enumerate(anime_ids)}
+            # Encoded values in the self.rating_df with new columns name user and anime
+            self.rating_df['user'] = user_codes.astype(np.int32)
+            self.rating_df['anime'] = anime_codes.astype(np.int32)
 
-            # Decode user ids 
-            self.user_encoded2user = {i:x for i,x in enumerate(user_ids)}
+            logger.info(f"Encoded {len(user_ids)} user and {len(anime_ids)} anime IDs.")
+        except Exception as e:
+            logger.error(f"Error encoding data: {e}")
+            raise CustomException(f"Error encoding data: {e}", "Data Encoding")
+        
+    def build_user_preferences(self,percentile=75):
+        try:
+            n_users = len(self.user2user_encoded)
+            users = self.rating_df['user'].to_numpy()
+            ratings = self.rating_df['rating'].to_numpy()
+            anime_ids = self.rating_df['anime_id'].to_numpy()
+
+            # Group rows by user with ratings ascending inside each user
+            order = np.lexsort((ratings,users))
+            users,ratings,anime_ids = users[order],ratings[order],anime_ids[order]
+
+            counts = np.bincount(users,minlength=n_users)
+            starts = np.concatenate(([0],np.cumsum(counts)[:-1]))
+
+            # Same linear interpolation as np.percentile, for every user at once
+            position = (counts - 1) * (percentile / 100)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            fraction = position - lower
+            low_value = ratings[starts + lower]
+            high_value = ratings[starts + upper]
+            diff = high_value - low_value
+            cut = np.where(fraction >= 0.5,
+                           high_value - diff * (1 - fraction),
+                           low_value + diff * fraction)
+
+            keep = ratings >= cut[users]
+            users,ratings,anime_ids = users[keep],ratings[keep],anime_ids[keep]
+
+            # Highest rated first inside each user row
+            order = np.lexsort((-ratings,users))
+
+            self.user_pref_offsets = np.concatenate(([0],np.cumsum(np.bincount(users,minlength=n_users)))).astype(np.int64)
+            self.user_pref_anime = anime_ids[order].astype(np.int32)
+
+            logger.info(f"Built user preference index for {n_users} users with {len(self.user_pref_anime)} entries.")
+        except Exception as e:
+            logger.error(f"Error building user preferences: {e}")
+            raise CustomException(f"Error building user preferences: {e}", "User Preferences")
 
-            # Decode anime ids
-            self.anime_encoded2anime = {i:x for i,x in enumerate(anime_ids)}
+    def build_user_history(self):
+        try:
+            n_users = len(self.user2user_encoded)
+            users = self.rating_df['user'].to_numpy()
+            anime = self.rating_df['anime'].to_numpy()
 
+            # Encoded anime ids fit int16 for the real catalogue, halving the index
+            anime_dtype = np.int16 if len(self.anime2anime_encoded) <= np.iinfo(np.int16).max else np.int32
+            order = np.lexsort((anime,users))
 
-            # Map the encoded values in the self.rating_df with new columns name user and anime 
-            self.rating_df['user'] = self.rating_df['user_id'].map(self.user2user_encoded)
-            self.rating_df['anime'] = self.rating_df['anime_id'].map(self.anime2anime_encoded)
+            self.user_history_offsets = np.concatenate(([0],np.cumsum(np.bincount(users,minlength=n_users)))).astype(np.int64)
+            self.user_history_anime = anime[order].astype(anime_dtype)
 
-            logger.info(f"Encoded user and anime IDs.")
+            logger.info(f"Built user history index with {len(self.user_history_anime)} entries ({anime_dtype.__name__}).")
         except Exception as e:
-            logger.error(f"Error encoding data: {e}")
-            raise CustomException(f"Error encoding data: {e}", "Data Encoding")
-        
+            logger.error(f"Error building user history: {e}")
+            raise CustomException(f"Error building user history: {e}", "User History")
+
     def split_data(self,test_size=1000,random_state=42):
 
         try:
@@ -130,78 +282,142 @@ class DataPreprocessing:
     def save_artifacts(self):
         try:
             artifacts = {
-                "user2user_encoded": self.user2user_encoded,
-                "user_encoded2user": self.user_encoded2user,
-                "anime2anime_encoded": self.anime2anime_encoded,
-                "anime_encoded2anime": self.anime_encoded2anime
+                USER2USER_ENCODED: self.user2user_encoded,
+                USER_ENCODED2USER: self.user_encoded2user,
+                ANIME2ANIME_ENCODED: self.anime2anime_encoded,
+                ANIME_ENCODED2ANIME: self.anime_encoded2anime
             }
 
-            for name, artifact in artifacts.items():
-                joblib.dump(artifact, os.path.join(self.output_dir, f"{name}.pkl"))
-                logger.info(f"Saved artifact: {name} to {self.output_dir}")
-                logger.info("Data Preprocessing artifacts saved successfully.")
+            # Encoders are stored as dense int32 arrays so serving can memory-map them
+            for path, artifact in artifacts.items():
+                save_array(path, artifact.codes, n_ids=len(artifact))
+                logger.info(f"Saved artifact: {path}")
+            logger.info("Data Preprocessing artifacts saved successfully.")
+
+            # Columnar, so training and serving memory-map them without parsing
+            save_columns(TRAIN_COLUMNS,{"user": self.X_train_array[0],"anime": self.X_train_array[1],"rating": self.y_train})
+            save_columns(TEST_COLUMNS,{"user": self.X_test_array[0],"anime": self.X_test_array[1],"rating": self.y_test})
+            save_columns(RATING_COLUMNS,{column: self.rating_df[column].to_numpy() for column in self.rating_df.columns})
+
+            save_array(USER_PREF_OFFSETS,self.user_pref_offsets)
+            save_array(USER_PREF_ANIME,self.user_pref_anime)
 
-            joblib.dump(self.X_train_array,X_TRAIN_ARRAY)
-            joblib.dump(self.X_test_array,X_TEST_ARRAY)
-            joblib.dump(self.y_train,Y_TRAIN)
-            joblib.dump(self.y_test,Y_TEST)
+            save_array(USER_HISTORY_OFFSETS,self.user_history_offsets)
+            save_array(USER_HISTORY_ANIME,self.user_history_anime)
 
 
-            self.rating_df.to_csv(RATING_DF,index=False)
+            if read_yaml(CONFIG_PATH).get('data_preprocessing',{}).get('export_csv',False):
+                self.rating_df.to_csv(RATING_DF,index=False)
+                logger.info(f"Exported rating dataframe to {RATING_DF} for debugging")
             logger.info(f"Saved processed data arrays and rating dataframe to {self.output_dir}")
         except Exception as e:
             logger.error(f"Error saving artifacts: {e}")
             raise CustomException(f"Error saving artifacts: {e}", "Artifact Saving")
         
 
-    def getAnimeName(self,df,anime_id):
-            try:
-                name = df[df.MAL_ID == anime_id]["English name"].values[0]
-                if name is np.nan:
-                    name = df[df.MAL_ID == anime_id]["Name"].values[0]
-            except:
-                print("Anime name not found!")
+    def build_anime_df(self,df):
+        '''
+        df : pd.DataFrame : raw anime.csv
+
+        Vectorized, linear in the number of titles: eng_version is the
+        English name falling back to Name, "Unknown" only becomes NaN in the
+        kept columns, numeric columns are parsed once and the repeated
+        serving metadata is categorical.
+
+        returns pd.DataFrame : processed anime df, highest Score first
+        '''
+        df = df[["MAL_ID","Name","English name","Score","Genres","Episodes","Type","Premiered","Studios","Members"]]
+        df = df.mask(df == "Unknown")
+
+        eng_version = df["English name"].fillna(df["Name"])
+        df = df.drop(columns=["Name","English name"]).assign(eng_version=eng_version)
+
+        for column in ["Score","Episodes","Members"]:
+            df[column] = pd.to_numeric(df[column],errors="coerce")
+        # Nullable, so unknown episode counts do not turn the csv into "12.0"
+        df["Episodes"] = df["Episodes"].astype("Int32")
+        df = df.astype({column: "category" for column in ANIME_CATEGORICAL_COLUMNS})
+
+        # Sort the df by 'Score' column in descending order
+        df = df.sort_values(by=["Score"],ascending=False,kind="stable",na_position="last")
+
+        return df[["MAL_ID","eng_version","Score","Genres","Episodes","Type","Premiered","Studios","Members"]]
 
-            return name
-    
     def process_anime_data(self):
         try:
             df = pd.read_csv(ANIME_CSV,low_memory=True)
             cols = ["MAL_ID","Name","Genres","sypnopsis"]
             synopsis_df = pd.read_csv(ANIMESYNOPSIS_CSV,low_memory=True,usecols=cols)
 
-            # Replace "Unknown" with NaN
-            df = df.replace("Unknown",np.nan)
-
-            # create a new column 'eng_version' by applying getAnimeName function
-            df["eng_version"] = df['MAL_ID'].apply(lambda x: self.getAnimeName(df,x))
-
-            # Sort the df by 'Score' column in descending order 
-            df.sort_values(by=["Score"], ascending=False,inplace=True,kind="quicksort",na_position="last")
-
-            # Use selected columns only 
-            df = df[["MAL_ID","eng_version","Score","Genres","Episodes","Type","Premiered","Studios","Members"]]
+            df = self.build_anime_df(df)
 
             # Save the processed anime dataframe 
             df.to_csv(DF,index=False)
             synopsis_df.to_csv(SYNOPSIS_DF_PATH,index=False)
             logger.info(f"Anime and Synopsis data processed and saved successfully.In paths: {DF} and {SYNOPSIS_DF_PATH}")
+
+            self.save_anime_text(synopsis_df)
+            self.save_popularity(df)
         
         except Exception as e:
             logger.error(f"Error in Processing anime and synopsis dataframe: {e}")
             raise CustomException(f"Error in Processing anime and synopsis dataframe: {e}", "Anime and Synopsis Data Processing") 
 
-            
+
+    def save_anime_text(self,synopsis_df):
+        try:
+            # Keyed on MAL_ID over the whole file, unrated titles keep their synopsis
+            rows = synopsis_df.drop_duplicates("MAL_ID").sort_values("MAL_ID")
+            for path,column in [(ANIME_NAME_TEXT,"Name"),(ANIME_GENRES_TEXT,"Genres"),(ANIME_SYNOPSIS_TEXT,"sypnopsis")]:
+                save_text(path,rows[column].tolist())
+            # Written last, the serving side only uses the stores once the ids exist
+            save_array(ANIME_TEXT_IDS,rows["MAL_ID"].to_numpy(dtype=np.int64))
+            logger.info(f"Saved name, genre and synopsis text stores for {len(rows)} anime")
+        except Exception as e:
+            logger.error(f"Error saving the synopsis text stores: {e}")
+            raise CustomException(f"Error saving the synopsis text stores: {e}", "Synopsis Text Stores")
+
+    def save_popularity(self,df):
+        try:
+            popularity_config = read_yaml(CONFIG_PATH).get('popularity',{})
+            ranking = popularity_ranking(df,top_n=popularity_config.get('top_n',100),
+                                         members_quantile=popularity_config.get('members_quantile',0.75))
+            with open(POPULARITY_PATH,"w") as popularity_file:
+                json.dump(ranking,popularity_file)
+            logger.info(f"Saved popularity ranking over {len(ranking['by_genre'])} genres to {POPULARITY_PATH}")
+        except Exception as e:
+            logger.error(f"Error building the popularity ranking: {e}")
+            raise CustomException(f"Error building the popularity ranking: {e}", "Popularity Ranking")
+
     def run(self):
         try:
             logger.info("Starting Data Preprocessing...")
-            self.load_data()
-            self.filter_users(min_ratings=400)
-            self.scale_ratings()
-            self.encode_data()
-            self.split_data(test_size=1000,random_state=42)
-            self.save_artifacts()
-            self.process_anime_data()
+            config = read_yaml(CONFIG_PATH).get('data_preprocessing',{})
+            min_ratings = config.get('min_ratings',400)
+            chunk_rows = config.get('chunk_rows',0)
+            if chunk_rows:
+                with self.stage("load_data_chunked"):
+                    self.load_data_chunked(min_ratings=min_ratings,chunk_rows=chunk_rows)
+            else:
+                with self.stage("load_data"):
+                    self.load_data()
+                with self.stage("filter_users"):
+                    self.filter_users(min_ratings=min_ratings)
+            with self.stage("scale_ratings"):
+                self.scale_ratings()
+            with self.stage("encode_data"):
+                self.encode_data()
+            with self.stage("build_user_preferences"):
+                self.build_user_preferences(percentile=75)
+            with self.stage("build_user_history"):
+                self.build_user_history()
+            with self.stage("split_data"):
+                self.split_data(test_size=1000,random_state=42)
+            with self.stage("save_artifacts"):
+                self.save_artifacts()
+            with self.stage("process_anime_data"):
+                self.process_anime_data()
+            self.log_stage_report()
             logger.info("Data Preprocessing pipeline completed successfully.")
         except Exception as e:
             logger.error(f"Error in Data Preprocessing pipeline run: {e}")
@@ -1,12 +1,19 @@
-import joblib
+import json
 from comet_ml import start
 import numpy as np
 import os 
 # from tensorflow.keras.callbacks import EarlyStopping,ModelCheckpoint,LearningRateScheduler
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, LearningRateScheduler
+from tensorflow.keras.layers import BatchNormalization
 from src.logger import get_logger
 from src.custom_exception import CustomException
 from src.base_model import BaseModel
+from utils.common_function import read_yaml
+from utils.ann_index import build_ann_index, save_ann_index
+from utils.array_store import save_array, load_array
+from utils.columnar import load_columns
+from utils.quantization import QuantizedTable, quantized_paths
+from utils.topk import neighbour_table
 import sys
 from config.paths_config import *
 
@@ -27,10 +34,13 @@ class ModelTraining:
 
     def load_data(self):
         try:
-            X_train_array = joblib.load(X_TRAIN_ARRAY)
-            X_test_array = joblib.load(X_TEST_ARRAY)
-            y_train = joblib.load(Y_TRAIN)
-            y_test = joblib.load(Y_TEST)
+            # Memory-mapped columns, nothing is parsed or unpickled
+            train = load_columns(TRAIN_COLUMNS)
+            test = load_columns(TEST_COLUMNS)
+            X_train_array = [train["user"],train["anime"]]
+            X_test_array = [test["user"],test["anime"]]
+            y_train = train["rating"]
+            y_test = test["rating"]
 
             logger.info(f"Data Loaded Sucessfully for Model Training")
 
@@ -55,8 +65,8 @@ class ModelTraining:
             X_train_array,X_test_array,y_train,y_test = self.load_data()
 
             # calculate the number of user
-            n_users = len(joblib.load(USER2USER_ENCODED))
-            n_anime = len(joblib.load(ANIME2ANIME_ENCODED))
+            n_users = len(load_array(USER_ENCODED2USER))
+            n_anime = len(load_array(ANIME_ENCODED2ANIME))
 
             base_model = BaseModel(config_path=CONFIG_PATH)
 
@@ -121,8 +131,21 @@ class ModelTraining:
             anime_weights = self.extract_weights("anime_embedding",model)
             user_weights = self.extract_weights("user_embedding",model)
 
-            joblib.dump(user_weights,USER_WEIGHTS_PATH)
-            joblib.dump(anime_weights,ANIME_WEIGHTS_PATH)
+            save_array(USER_WEIGHTS_PATH,user_weights.astype(np.float32),normalized=True)
+            save_array(ANIME_WEIGHTS_PATH,anime_weights.astype(np.float32),normalized=True)
+
+            # float16 / int8 copies for the quantized serving modes
+            for path,weights in [(USER_WEIGHTS_PATH,user_weights),(ANIME_WEIGHTS_PATH,anime_weights)]:
+                for precision in ("float16","int8"):
+                    quantized = QuantizedTable.quantize(weights,precision)
+                    codes_path,scales_path = quantized_paths(path,precision)
+                    save_array(codes_path,quantized.codes,normalized=True)
+                    if quantized.scales is not None:
+                        save_array(scales_path,quantized.scales)
+
+            self.save_scoring_head(model)
+            self.save_anime_neighbours(anime_weights)
+            self.save_user_ann_index(user_weights)
 
             self.experiment.log_asset(MODEL_PATH)
             self.experiment.log_asset(ANIME_WEIGHTS_PATH)
@@ -134,7 +157,58 @@ class ModelTraining:
         except Exception as e:
             logger.error(f"Error in saved the model weights,{e}")
             raise CustomException(f"Error in save the model anime and user weights",e)
-        
+
+    def save_scoring_head(self,model):
+        try:
+            # Everything after the normalized dot product: Dense(1) -> BatchNormalization -> sigmoid
+            kernel,bias = model.get_layer("dense_layer").get_weights()
+            batch_norm = next(layer for layer in model.layers if isinstance(layer,BatchNormalization))
+            gamma,beta,moving_mean,moving_variance = batch_norm.get_weights()
+
+            scoring_head = {
+                "dense_kernel": float(kernel.ravel()[0]),
+                "dense_bias": float(bias.ravel()[0]),
+                "bn_gamma": float(gamma.ravel()[0]),
+                "bn_beta": float(beta.ravel()[0]),
+                "bn_moving_mean": float(moving_mean.ravel()[0]),
+                "bn_moving_variance": float(moving_variance.ravel()[0]),
+                "bn_epsilon": float(batch_norm.epsilon),
+            }
+            with open(SCORING_HEAD_PATH,"w") as scoring_head_file:
+                json.dump(scoring_head,scoring_head_file,indent=2)
+            logger.info(f"Saved the scoring head parameters to {SCORING_HEAD_PATH}")
+
+        except Exception as e:
+            logger.error(f"Error in exporting the scoring head,{e}")
+            raise CustomException(f"Error in exporting the scoring head",e)
+
+    def save_anime_neighbours(self,anime_weights):
+        try:
+            neighbours_config = read_yaml(CONFIG_PATH)['anime_neighbours']
+            neighbours,similarities = neighbour_table(anime_weights,k=neighbours_config['k'],
+                                                      block_rows=neighbours_config['block_rows'])
+
+            save_array(ANIME_NEIGHBOURS_PATH,neighbours)
+            save_array(ANIME_NEIGHBOUR_SIMILARITY_PATH,similarities)
+            logger.info(f"Saved top {neighbours.shape[1]} anime neighbour table to {ANIME_NEIGHBOURS_PATH}")
+
+        except Exception as e:
+            logger.error(f"Error in building the anime neighbour table,{e}")
+            raise CustomException(f"Error in building the anime neighbour table",e)
+
+    def save_user_ann_index(self,user_weights):
+        # Similar anime come from the exact neighbour table, only the user side needs an ann index
+        try:
+            ann_config = dict(read_yaml(CONFIG_PATH)['ann'])
+            kind = ann_config.pop('kind')
+
+            ann_index = build_ann_index(user_weights,kind=kind,**ann_config)
+            save_ann_index(ann_index,USER_ANN_INDEX_PATH)
+            logger.info(f"Saved {kind} ann index to {USER_ANN_INDEX_PATH}")
+
+        except Exception as e:
+            logger.error(f"Error in building the user ann index,{e}")
+            raise CustomException(f"Error in building the user ann index",e)
         
 
 if __name__ == "__main__":
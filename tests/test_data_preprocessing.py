@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.data_preprocessing import DataPreprocessing
+
+
+@pytest.fixture
+def animelist_csv(tmp_path):
+    # Users rate 1 to 12 titles in shuffled order, so user rows straddle chunks
+    rng = np.random.default_rng(0)
+    n_ratings = rng.integers(1, 13, size=40)
+    rating_df = pd.DataFrame({
+        "user_id": np.repeat(rng.choice(1000, size=40, replace=False), n_ratings),
+        "anime_id": np.concatenate([rng.choice(300, size=n, replace=False) + 1 for n in n_ratings]),
+        "rating": rng.integers(0, 11, size=n_ratings.sum()),
+        "watching_status": 1,
+    }).sample(frac=1, random_state=0)
+    path = tmp_path / "animelist.csv"
+    rating_df.to_csv(path, index=False)
+    return str(path)
+
+
+def preprocessor(input_file, tmp_path):
+    return DataPreprocessing(input_file=input_file, output_dir=str(tmp_path / "processed"))
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 64, 100000])
+def test_load_data_chunked_matches_load_and_filter(animelist_csv, tmp_path, chunk_rows):
+    expected = preprocessor(animelist_csv, tmp_path)
+    expected.load_data()
+    expected.filter_users(min_ratings=5)
+
+    chunked = preprocessor(animelist_csv, tmp_path)
+    chunked.load_data_chunked(min_ratings=5, chunk_rows=chunk_rows)
+
+    for column in ["user_id", "anime_id", "rating"]:
+        np.testing.assert_array_equal(chunked.rating_df[column].to_numpy(), expected.rating_df[column].to_numpy())
+
+
+def test_encode_data_matches_enumerated_dicts(animelist_csv, tmp_path):
+    data = preprocessor(animelist_csv, tmp_path)
+    data.load_data()
+    data.encode_data()
+
+    # The dicts encode_data replaced
+    user_ids = data.rating_df['user_id'].unique().tolist()
+    user2user_encoded = {x: i for i, x in enumerate(user_ids)}
+    anime_ids = data.rating_df['anime_id'].unique().tolist()
+    anime2anime_encoded = {x: i for i, x in enumerate(anime_ids)}
+
+    np.testing.assert_array_equal(data.rating_df['user'], data.rating_df['user_id'].map(user2user_encoded))
+    np.testing.assert_array_equal(data.rating_df['anime'], data.rating_df['anime_id'].map(anime2anime_encoded))
+    assert [data.user_encoded2user[code] for code in range(len(user_ids))] == user_ids
+    assert [data.anime_encoded2anime[code] for code in range(len(anime_ids))] == anime_ids
+    assert all(data.user2user_encoded[user_id] == code for user_id, code in user2user_encoded.items())
+    assert len(data.user2user_encoded) == len(user_ids)
+    assert len(data.anime2anime_encoded) == len(anime_ids)
+
+
+def test_user_preferences_match_the_percentile_filter(animelist_csv, tmp_path):
+    data = preprocessor(animelist_csv, tmp_path)
+    data.load_data()
+    data.scale_ratings()
+    data.encode_data()
+    data.build_user_preferences(percentile=75)
+
+    offsets, preferred = data.user_pref_offsets, data.user_pref_anime
+    assert len(offsets) == len(data.user2user_encoded) + 1
+    assert offsets[0] == 0 and offsets[-1] == len(preferred)
+    assert (np.diff(offsets) > 0).all()
+
+    for user, user_rows in data.rating_df.groupby('user'):
+        # The per-request pandas filter the CSR index replaced
+        cut = np.percentile(user_rows['rating'], 75)
+        liked = user_rows[user_rows['rating'] >= cut].sort_values(by='rating', ascending=False)
+
+        row = preferred[offsets[user]:offsets[user + 1]]
+        assert sorted(row.tolist()) == sorted(liked['anime_id'].tolist())
+        # Highest rated first, tied titles in any order
+        ratings = liked.set_index('anime_id')['rating']
+        row_ratings = [ratings[anime_id] for anime_id in row]
+        assert row_ratings == sorted(row_ratings, reverse=True)
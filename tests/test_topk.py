@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from utils.topk import top_k, similarity_top_k, neighbour_table
+
+
+def reference_top_k(scores, k, largest=True):
+    # The full stable argsort the partial selection replaced
+    keyed = -scores if largest else scores
+    return np.argsort(keyed, axis=-1, kind="stable")[..., :k]
+
+
+def normalized_weights(n_items=60, dim=8, seed=0):
+    weights = np.random.default_rng(seed).normal(size=(n_items, dim)).astype(np.float32)
+    return weights / np.linalg.norm(weights, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("k", [1, 5, 49, 50, 80])
+@pytest.mark.parametrize("largest", [True, False])
+def test_top_k_matches_argsort(k, largest):
+    scores = np.random.default_rng(1).permutation(50).astype(np.float32)
+    np.testing.assert_array_equal(top_k(scores, k, largest=largest), reference_top_k(scores, k, largest=largest))
+
+
+def test_top_k_rows_are_independent():
+    scores = np.random.default_rng(2).normal(size=(6, 40))
+    np.testing.assert_array_equal(top_k(scores, 7), reference_top_k(scores, 7))
+
+
+def test_top_k_ties_keep_the_same_scores():
+    # Which tied index survives the partition is unspecified, the scores are not
+    scores = np.array([3, 1, 3, 2, 3, 1, 2, 3], dtype=np.float32)
+    for k in range(1, len(scores) + 1):
+        selected = top_k(scores, k)
+        assert len(set(selected.tolist())) == k
+        np.testing.assert_array_equal(scores[selected], scores[reference_top_k(scores, k)])
+
+
+def test_top_k_keeps_index_order_when_every_item_is_kept():
+    scores = np.array([2, 1, 2, 1, 2], dtype=np.float32)
+    np.testing.assert_array_equal(top_k(scores, 5), [0, 2, 4, 1, 3])
+
+
+def test_top_k_empty_selection():
+    assert top_k(np.ones((3, 4)), 0).shape == (3, 0)
+
+
+def test_similarity_top_k_matches_argsort():
+    weights = normalized_weights()
+    queries = weights[[0, 7, 13]]
+    indices, similarities = similarity_top_k(weights, queries, 5)
+
+    scores = queries @ weights.T
+    expected = reference_top_k(scores, 5)
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_allclose(similarities, np.take_along_axis(scores, expected, axis=-1))
+    # Queries taken from the table find themselves first
+    np.testing.assert_array_equal(indices[:, 0], [0, 7, 13])
+
+
+@pytest.mark.parametrize("block_rows", [7, 1024])
+def test_neighbour_table_matches_argsort_without_self(block_rows):
+    weights = normalized_weights()
+    indices, similarities = neighbour_table(weights, 10, block_rows=block_rows)
+
+    scores = weights @ weights.T
+    np.fill_diagonal(scores, -np.inf)
+    expected = reference_top_k(scores, 10)
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_allclose(similarities, np.take_along_axis(scores, expected, axis=-1), rtol=1e-6)
+    assert not (indices == np.arange(len(weights))[:, None]).any()
+
+
+def test_neighbour_table_caps_k_at_the_other_items():
+    indices, _ = neighbour_table(normalized_weights(n_items=4), 10)
+    assert indices.shape == (4, 3)
+    for item, neighbours in enumerate(indices):
+        assert sorted(neighbours.tolist()) == [other for other in range(4) if other != item]
@@ -0,0 +1,178 @@
+import numpy as np
+from utils.topk import top_k
+
+
+class IVFIndex:
+    '''
+    Inverted file index: spherical k-means coarse quantizer over normalized
+    embeddings, searched by scanning the n_probe closest lists only.
+    '''
+
+    kind = "ivf"
+    PARAMS = ("n_lists", "kmeans_iterations", "n_probe", "seed")
+
+    def __init__(self, n_lists=0, kmeans_iterations=10, n_probe=8, seed=42):
+        self.n_lists = n_lists
+        self.kmeans_iterations = kmeans_iterations
+        self.n_probe = n_probe
+        self.seed = seed
+
+        self.weights = None
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+
+    def build(self, weights):
+        weights = np.asarray(weights, dtype=np.float32)
+        n_items = weights.shape[0]
+        n_lists = self.n_lists or int(4 * np.sqrt(n_items))
+        n_lists = max(1, min(n_lists, n_items))
+
+        rng = np.random.default_rng(self.seed)
+        centroids = weights[rng.choice(n_items, n_lists, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignment = np.argmax(weights @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, weights)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        assignment = np.argmax(weights @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.list_ids = np.argsort(assignment, kind="stable").astype(np.int32)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=n_lists)))).astype(np.int64)
+        self.weights = weights
+        return self
+
+    def candidates(self, query, n_probe):
+        lists = top_k(self.centroids @ query, n_probe)
+        return np.concatenate([self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+
+    def arrays(self):
+        return {"centroids": self.centroids, "list_offsets": self.list_offsets, "list_ids": self.list_ids}
+
+    def restore(self, arrays, weights):
+        self.centroids = arrays["centroids"]
+        self.list_offsets = arrays["list_offsets"]
+        self.list_ids = arrays["list_ids"]
+        self.n_lists = len(self.centroids)
+        self.weights = weights
+        return self
+
+
+class LSHIndex:
+    '''
+    Random hyperplane LSH: every table hashes a vector to the sign pattern of
+    n_bits projections; search scans the buckets of the first n_probe tables.
+    '''
+
+    kind = "lsh"
+    PARAMS = ("n_bits", "n_tables", "n_probe", "seed")
+
+    def __init__(self, n_bits=12, n_tables=8, n_probe=8, seed=42):
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        self.n_probe = n_probe
+        self.seed = seed
+
+        self.weights = None
+        self.planes = None
+        self.bucket_codes = None
+        self.bucket_ids = None
+
+    def _hash(self, vectors):
+        # (n_tables, n_items) integer codes built from the projection signs
+        bits = (np.einsum("tbd,nd->tnb", self.planes, np.atleast_2d(vectors)) > 0).astype(np.int64)
+        return bits @ (1 << np.arange(self.n_bits, dtype=np.int64))
+
+    def build(self, weights):
+        weights = np.asarray(weights, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.n_tables, self.n_bits, weights.shape[1])).astype(np.float32)
+
+        codes = self._hash(weights)
+        order = np.argsort(codes, axis=1, kind="stable")
+        self.bucket_codes = np.take_along_axis(codes, order, axis=1)
+        self.bucket_ids = order.astype(np.int32)
+        self.weights = weights
+        return self
+
+    def candidates(self, query, n_probe):
+        codes = self._hash(query)[:, 0]
+        found = []
+        for table in range(min(n_probe, self.n_tables)):
+            table_codes = self.bucket_codes[table]
+            start = np.searchsorted(table_codes, codes[table], side="left")
+            end = np.searchsorted(table_codes, codes[table], side="right")
+            found.append(self.bucket_ids[table, start:end])
+        return np.unique(np.concatenate(found))
+
+    def arrays(self):
+        return {"planes": self.planes, "bucket_codes": self.bucket_codes, "bucket_ids": self.bucket_ids}
+
+    def restore(self, arrays, weights):
+        self.planes = arrays["planes"]
+        self.bucket_codes = arrays["bucket_codes"]
+        self.bucket_ids = arrays["bucket_ids"]
+        self.n_tables, self.n_bits = self.planes.shape[:2]
+        self.weights = weights
+        return self
+
+
+ANN_INDEXES = {IVFIndex.kind: IVFIndex, LSHIndex.kind: LSHIndex}
+
+
+def search(ann_index, queries, k, n_probe=None, largest=True):
+    '''
+    ann_index : IVFIndex | LSHIndex : built or restored index
+    queries : np.ndarray : (dim,) or (n_queries, dim) query vectors
+    k : int : neighbours to return per query
+    n_probe : int : lists / tables scanned per query, the recall vs latency knob
+
+    returns (indices, similarities) each shaped (n_queries, k), best first.
+    Rows with fewer than k candidates are padded with -1 / -inf.
+    '''
+    queries = np.atleast_2d(queries)
+    n_probe = n_probe or ann_index.n_probe
+
+    indices = np.full((len(queries), k), -1, dtype=np.int64)
+    similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+    for row, query in enumerate(queries):
+        candidates = ann_index.candidates(query, n_probe)
+        scores = ann_index.weights[candidates] @ query
+        best = top_k(scores, k, largest=largest)
+        indices[row, :len(best)] = candidates[best]
+        similarities[row, :len(best)] = scores[best]
+
+    return indices, similarities
+
+
+def build_ann_index(weights, kind="ivf", **params):
+    '''
+    weights : np.ndarray : normalized embedding table
+    kind : str : "ivf" or "lsh"
+    params : settings from the ann section of config.yaml, keys that do not
+    apply to the chosen kind are ignored
+    '''
+    ann_class = ANN_INDEXES[kind]
+    params = {key: value for key, value in params.items() if key in ann_class.PARAMS}
+    return ann_class(**params).build(weights)
+
+
+def save_ann_index(ann_index, path):
+    np.savez(path, kind=np.array(ann_index.kind), n_probe=np.array(ann_index.n_probe), **ann_index.arrays())
+
+
+def load_ann_index(path, weights):
+    '''
+    path : str : .npz written by save_ann_index
+    weights : np.ndarray : the embedding table the index was built from
+    '''
+    with np.load(path) as arrays:
+        arrays = dict(arrays)
+    ann_index = ANN_INDEXES[str(arrays.pop("kind"))](n_probe=int(arrays.pop("n_probe")))
+    return ann_index.restore(arrays, weights)
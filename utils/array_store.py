@@ -0,0 +1,103 @@
+import os
+import json
+import numpy as np
+
+
+def header_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def staging_path(path):
+    # Same directory as path, so os.replace is an atomic rename
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def save_array(path, array, **meta):
+    '''
+    path : str : .npy destination
+    array : np.ndarray : array to store in the raw .npy layout
+    meta : extra fields written to the json header next to it
+
+    The json header records shape and dtype so readers can validate the
+    memory-mapped file without unpickling anything.
+
+    Both files are written next to their target and renamed over it: a
+    process that memory-mapped the old file keeps the old inode instead of
+    seeing it rewritten (or truncated, SIGBUS) underneath it.
+    '''
+    array = np.ascontiguousarray(array)
+    staging = staging_path(path)
+    with open(staging, "wb") as array_file:
+        np.save(array_file, array)
+    os.replace(staging, path)
+
+    header = {"file": os.path.basename(path), "shape": list(array.shape), "dtype": str(array.dtype), **meta}
+    staging = staging_path(header_path(path))
+    with open(staging, "w") as header_file:
+        json.dump(header, header_file, indent=2)
+    os.replace(staging, header_path(path))
+
+
+def load_array(path, mmap_mode="r"):
+    '''
+    Memory-maps a .npy written by save_array, so every process on the host
+    shares the same page-cached copy.
+    '''
+    array = np.load(path, mmap_mode=mmap_mode)
+    if os.path.exists(header_path(path)):
+        with open(header_path(path)) as header_file:
+            header = json.load(header_file)
+        if list(array.shape) != header["shape"] or str(array.dtype) != header["dtype"]:
+            raise ValueError(f"{path} does not match its header: {array.shape} {array.dtype} vs {header['shape']} {header['dtype']}")
+    return array
+
+
+def dense_lookup(ids):
+    '''
+    ids : np.ndarray : distinct non-negative ints, position = code (e.g. pd.factorize uniques)
+
+    returns np.ndarray : int32 array a with a[ids[i]] = i, -1 for other ids
+    '''
+    ids = np.asarray(ids, dtype=np.int64)
+    dense = np.full(ids.max() + 1 if len(ids) else 0, -1, dtype=np.int32)
+    dense[ids] = np.arange(len(ids), dtype=np.int32)
+    return dense
+
+
+class DenseEncoder:
+    '''
+    Dict-like read-only view over a dense int32 id array (-1 = missing), so
+    the serving helpers keep using .get / in / [] on encoders.
+    '''
+
+    def __init__(self, codes):
+        self.codes = codes
+        self._size = None
+
+    def get(self, key, default=None):
+        if not isinstance(key, (int, np.integer)) or key < 0 or key >= len(self.codes):
+            return default
+        value = self.codes[key]
+        return default if value < 0 else int(value)
+
+    def encode(self, keys):
+        # Vectorized lookup, -1 for unknown keys
+        keys = np.asarray(keys, dtype=np.int64)
+        valid = (keys >= 0) & (keys < len(self.codes))
+        codes = np.full(keys.shape, -1, dtype=np.int32)
+        codes[valid] = self.codes[keys[valid]]
+        return codes
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __len__(self):
+        if self._size is None:
+            self._size = int(np.count_nonzero(np.asarray(self.codes) >= 0))
+        return self._size
@@ -0,0 +1,245 @@
+'''
+Immutable, versioned copies of the serving artifacts.
+
+Training keeps writing to artifacts/processed, artifacts/weights and
+artifacts/model; publish_release then copies the serving files into
+artifacts/releases/<version>/ with a manifest and moves the CURRENT pointer.
+Servers watch CURRENT and swap to the new version without a restart.
+
+    python -m utils.artifact_store publish
+    python -m utils.artifact_store list
+    python -m utils.artifact_store rollback 20261018T101500Z-3f2a9c1d
+'''
+import os
+import sys
+import json
+import stat
+import shutil
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from src.logger import get_logger
+from src.custom_exception import CustomException
+from config.paths_config import *
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+RELEASE_DIRS = [PROCESSED_DIR, WEIGHTS_DIR, MODEL_DIR]
+# Only needed to train, never read by the servers (files or whole directories)
+TRAINING_ONLY = [TRAIN_COLUMNS, TEST_COLUMNS]
+# The full ratings, only served when there is no CSR preference index
+RATING_PATHS = [RATING_COLUMNS, RATING_DF]
+USER_PREF_PATHS = [USER_PREF_OFFSETS, USER_PREF_ANIME]
+
+
+def release_dir(version):
+    return os.path.join(RELEASES_DIR, version)
+
+
+def release_path(root, path):
+    '''
+    root : str : release directory (or ARTIFACTS_DIR for the working copy)
+    path : str : artifact path from paths_config, e.g. ANIME_WEIGHTS_PATH
+
+    returns str : where that artifact lives under root
+    '''
+    if os.path.normpath(root) == os.path.normpath(ARTIFACTS_DIR):
+        return path
+    return os.path.join(root, os.path.relpath(path, ARTIFACTS_DIR))
+
+
+def current_release():
+    '''
+    returns str : version CURRENT points at, None when nothing is published
+    '''
+    try:
+        with open(CURRENT_RELEASE) as pointer:
+            return pointer.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(version):
+    with open(os.path.join(release_dir(version), RELEASE_MANIFEST)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def list_releases():
+    # Staging directories start with a dot and have no manifest yet
+    if not os.path.isdir(RELEASES_DIR):
+        return []
+    return sorted(entry.name for entry in os.scandir(RELEASES_DIR)
+                  if entry.is_dir() and not entry.name.startswith(".")
+                  and os.path.exists(os.path.join(entry.path, RELEASE_MANIFEST)))
+
+
+def set_current_release(version):
+    '''
+    Atomically points CURRENT at a published version (also used to roll back).
+    '''
+    if version not in list_releases():
+        raise CustomException(f"Release {version} is not published under {RELEASES_DIR}")
+    staging = f"{CURRENT_RELEASE}.{os.getpid()}.tmp"
+    with open(staging, "w") as pointer:
+        pointer.write(version + "\n")
+    os.replace(staging, CURRENT_RELEASE)
+    logger.info(f"Current release is now {version}")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as artifact:
+        for block in iter(lambda: artifact.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _content_hash(checksums):
+    return hashlib.sha256(json.dumps(checksums, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def _release_files():
+    excluded = list(TRAINING_ONLY)
+    if all(os.path.exists(path) for path in USER_PREF_PATHS):
+        excluded += RATING_PATHS
+    training_only = {os.path.normpath(path) for path in excluded}
+    files = []
+    for directory in RELEASE_DIRS:
+        # Recursive, columnar datasets are directories
+        for root, subdirectories, names in os.walk(directory):
+            subdirectories[:] = sorted(name for name in subdirectories
+                                       if os.path.normpath(os.path.join(root, name)) not in training_only)
+            files.extend(os.path.join(root, name) for name in sorted(names)
+                         if os.path.normpath(os.path.join(root, name)) not in training_only)
+    return files
+
+
+def artifacts_version(dirs=(WEIGHTS_DIR, PROCESSED_DIR)):
+    '''
+    Fingerprint of every file under the artifact directories, recursively
+    (path, size and mtime). The unversioned working copy's stand-in for a
+    release version, taken when an index first reads it.
+    '''
+    digest = hashlib.sha1()
+    for directory in dirs:
+        for root, subdirectories, names in os.walk(directory):
+            subdirectories.sort()
+            for name in sorted(names):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f"{root}/{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def publish_release(version=None, keep=5, make_current=True):
+    '''
+    version : str : release name, defaults to a UTC timestamp plus content hash
+    keep : int : published versions to keep, 0 keeps everything
+    make_current : bool : move CURRENT to the new release
+
+    Copies (never links, training overwrites its files in place) every
+    serving artifact into a staging directory, writes the manifest, makes
+    the files read-only and renames the directory into place, so a release
+    is either complete or absent. Without an explicit version, artifacts
+    identical to the CURRENT release are not published again.
+
+    returns str : the published version, or CURRENT when nothing changed
+    '''
+    try:
+        files = _release_files()
+        if not files:
+            raise CustomException(f"No artifacts to publish under {RELEASE_DIRS}")
+
+        checksums = {os.path.relpath(path, ARTIFACTS_DIR): _sha256(path) for path in files}
+        if version is None:
+            content = _content_hash(checksums)
+            current = current_release()
+            if current in list_releases():
+                published = {relative: entry["sha256"] for relative, entry in read_manifest(current)["files"].items()}
+                if _content_hash(published) == content:
+                    logger.info(f"Artifacts unchanged since release {current}, nothing to publish")
+                    return current
+            version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{content}"
+        if os.path.exists(release_dir(version)):
+            raise CustomException(f"Release {version} already exists, releases are immutable")
+
+        staging = os.path.join(RELEASES_DIR, f".staging-{version}")
+        shutil.rmtree(staging, ignore_errors=True)
+        manifest = {"version": version, "created_at": datetime.now(timezone.utc).isoformat(), "files": {}}
+        for path in files:
+            relative = os.path.relpath(path, ARTIFACTS_DIR)
+            destination = os.path.join(staging, relative)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copy2(path, destination)
+            os.chmod(destination, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            manifest["files"][relative] = {"size": os.path.getsize(destination), "sha256": checksums[relative]}
+
+        with open(os.path.join(staging, RELEASE_MANIFEST), "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.rename(staging, release_dir(version))
+        logger.info(f"Published release {version} with {len(files)} artifacts to {release_dir(version)}")
+
+        if make_current:
+            set_current_release(version)
+        if keep:
+            prune_releases(keep)
+        return version
+
+    except Exception as e:
+        logger.error(f"Error publishing the artifact release: {e}")
+        raise CustomException(f"Error publishing the artifact release", e)
+
+
+def verify_release(version, checksums=False):
+    '''
+    Checks every manifest file is present with its recorded size (and
+    sha256 when checksums is set) before a server loads the release.
+    '''
+    manifest = read_manifest(version)
+    for relative, expected in manifest["files"].items():
+        path = os.path.join(release_dir(version), relative)
+        if not os.path.exists(path) or os.path.getsize(path) != expected["size"]:
+            raise CustomException(f"Release {version} is incomplete: {relative}")
+        if checksums and _sha256(path) != expected["sha256"]:
+            raise CustomException(f"Release {version} is corrupted: {relative}")
+    return manifest
+
+
+def prune_releases(keep):
+    # Oldest first, never the release CURRENT points at
+    current = current_release()
+    for version in list_releases()[:-keep]:
+        if version != current:
+            shutil.rmtree(release_dir(version))
+            logger.info(f"Pruned release {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage published artifact releases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="publish the working artifacts as a new release")
+    publish.add_argument("--version", default=None)
+    publish.add_argument("--keep", type=int, default=5)
+    publish.add_argument("--no-current", action="store_true", help="publish without moving CURRENT")
+    commands.add_parser("list", help="list published releases")
+    rollback = commands.add_parser("rollback", help="point CURRENT at an older release")
+    rollback.add_argument("version")
+    verify = commands.add_parser("verify", help="check a release against its manifest checksums")
+    verify.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        print(publish_release(args.version, keep=args.keep, make_current=not args.no_current))
+    elif args.command == "list":
+        current = current_release()
+        for version in list_releases():
+            print(f"{'*' if version == current else ' '} {version}")
+    elif args.command == "rollback":
+        set_current_release(args.version)
+    elif args.command == "verify":
+        verify_release(args.version, checksums=True)
+        print(f"{args.version} OK")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
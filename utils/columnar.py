@@ -0,0 +1,83 @@
+'''
+Column-per-file datasets: every column is a raw .npy (see array_store) in
+one directory, with a schema.json manifest listing the columns, dtypes and
+row count. Reading is zero-parse and memory-mapped, and a reader can load
+only the columns it needs.
+
+    processed/train/schema.json
+    processed/train/user.npy  anime.npy  rating.npy
+'''
+import os
+import json
+import numpy as np
+import pandas as pd
+from utils.array_store import save_array, load_array
+from config.paths_config import COLUMNAR_SCHEMA
+
+
+def schema_path(directory):
+    return os.path.join(directory, COLUMNAR_SCHEMA)
+
+
+def has_columns(directory):
+    return os.path.exists(schema_path(directory))
+
+
+def read_schema(directory):
+    with open(schema_path(directory)) as schema_file:
+        return json.load(schema_file)
+
+
+def save_columns(directory, columns, **meta):
+    '''
+    directory : str : dataset directory, created if missing
+    columns : dict : column name -> 1-d array, all the same length
+    meta : extra fields written to the schema
+
+    The schema is written last (and atomically), so a directory with a
+    schema always holds a complete dataset.
+    '''
+    lengths = {name: len(values) for name, values in columns.items()}
+    if len(set(lengths.values())) > 1:
+        raise ValueError(f"Columns of {directory} differ in length: {lengths}")
+
+    os.makedirs(directory, exist_ok=True)
+    if has_columns(directory):
+        os.remove(schema_path(directory))
+
+    schema = {"rows": next(iter(lengths.values()), 0), "columns": [], **meta}
+    for name, values in columns.items():
+        values = np.asarray(values)
+        save_array(os.path.join(directory, f"{name}.npy"), values)
+        schema["columns"].append({"name": name, "file": f"{name}.npy", "dtype": str(values.dtype)})
+
+    staging = schema_path(directory) + ".tmp"
+    with open(staging, "w") as schema_file:
+        json.dump(schema, schema_file, indent=2)
+    os.replace(staging, schema_path(directory))
+
+
+def load_columns(directory, columns=None, mmap_mode="r"):
+    '''
+    directory : str : dataset written by save_columns
+    columns : list : names to load, default every column in schema order
+
+    returns dict : column name -> memory-mapped array
+    '''
+    schema = read_schema(directory)
+    available = {column["name"]: column for column in schema["columns"]}
+    names = list(available) if columns is None else columns
+
+    loaded = {}
+    for name in names:
+        if name not in available:
+            raise KeyError(f"{directory} has no column {name}, only {list(available)}")
+        values = load_array(os.path.join(directory, available[name]["file"]), mmap_mode=mmap_mode)
+        if len(values) != schema["rows"] or str(values.dtype) != available[name]["dtype"]:
+            raise ValueError(f"{directory}/{name} does not match the schema")
+        loaded[name] = values
+    return loaded
+
+
+def load_frame(directory, columns=None):
+    return pd.DataFrame(load_columns(directory, columns))
@@ -0,0 +1,72 @@
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from src.logger import get_logger
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    '''
+    Runs every task with the submitting thread's context variables, so the
+    stages of a request see the recommender index that request is pinned to.
+    '''
+
+    def __init__(self, max_workers, max_in_flight=None, **kwargs):
+        '''
+        max_in_flight : int : queued plus running tasks admitted through
+        submit_before, 2 * max_workers by default
+        '''
+        super().__init__(max_workers=max_workers, **kwargs)
+        self._slots = threading.BoundedSemaphore(max_in_flight or 2 * max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def submit_before(self, deadline, fn, /, *args, **kwargs):
+        '''
+        Submits fn once an in-flight slot frees up, waiting at most until
+        deadline (time.monotonic()). A slot is given back when its task
+        finishes or is cancelled, so a burst of slow requests cannot queue
+        unbounded work in front of later ones.
+
+        returns Future, None when no slot freed up in time
+        '''
+        if not self._slots.acquire(timeout=remaining(deadline)):
+            return None
+        try:
+            future = self.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=4, max_in_flight=None):
+    '''
+    Process wide bounded thread pool for the recommendation stages.
+
+    Threads do not survive fork, so a pool created in a gunicorn master
+    (e.g. during warm-up) is replaced by a fresh one in each worker.
+    '''
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ContextThreadPoolExecutor(max_workers=max_workers, max_in_flight=max_in_flight,
+                                                      thread_name_prefix="recommender")
+                _executor_pid = os.getpid()
+                logger.info(f"Recommendation thread pool started with {max_workers} workers.")
+    return _executor
+
+
+def remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
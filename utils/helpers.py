@@ -1,36 +1,83 @@
-import pandas as pd 
 import numpy as np 
-import joblib 
+import pandas as pd 
+from collections import Counter
 from config.paths_config import *
+from utils.recommender_index import get_recommender_index
+from utils.topk import top_k,similarity_top_k
+from utils.ann_index import search
+from utils.quantization import similarity_scores
+from utils.model_scoring import score_catalogue
+from utils.metrics import timed
 
 ################# 1. GET_ANIME_FRAME
 
 def getAnimeFrame(anime,path_df):
-  df = pd.read_csv(path_df)
+  index = get_recommender_index()
   if isinstance(anime,int):
-    return df[df['MAL_ID'] == anime]
+    return index.rows(path_df,'MAL_ID',anime)
   if isinstance(anime,str):
-    return df[df['eng_version'] == anime]
+    anime_frame = index.rows(path_df,'eng_version',anime)
+    if anime_frame.empty and path_df == DF:
+      # Case / punctuation insensitive, also matches the synopsis Name
+      anime_frame = index.get(path_df).iloc[index.title_index().rows_of_name(anime)]
+    return anime_frame
   
 
 ##################### 2. GET_SYSNOPSIS 
 def getSypnopsis(anime,path_synopsis_df):
-  synopsis_df = pd.read_csv(path_synopsis_df)
+  index = get_recommender_index()
+  if path_synopsis_df == SYNOPSIS_DF_PATH and index.has_anime_text():
+    # Only the requested synopsis is decoded from the memory-mapped store
+    if isinstance(anime,str):
+      rows = index.title_index().rows_of_name(anime)
+      anime = int(index.title_index().anime_ids[rows[0]]) if rows else None
+    return index.anime_text(ANIME_SYNOPSIS_TEXT,[anime])[0] if anime is not None else None
   if isinstance(anime,int):
-    return synopsis_df[synopsis_df['MAL_ID'] == anime]['sypnopsis'].values[0]
+    return index.rows(path_synopsis_df,'MAL_ID',anime)['sypnopsis'].values[0]
   if isinstance(anime,str):
-    return synopsis_df[synopsis_df['Name'] == anime]['sypnopsis'].values[0]
+    synopsis_frame = index.rows(path_synopsis_df,'Name',anime)
+    if synopsis_frame.empty and path_synopsis_df == SYNOPSIS_DF_PATH:
+      titles = index.title_index()
+      for row in titles.rows_of_name(anime):
+        synopsis_frame = index.rows(path_synopsis_df,'MAL_ID',int(titles.anime_ids[row]))
+        if not synopsis_frame.empty:
+          break
+    return synopsis_frame['sypnopsis'].values[0]
   
 
 #################### 3.content Recommendation 
 
+def _similar_animes_frame(index,closest,similarities,encoded2anime,path_df):
+
+    similarityArr = []
+
+    for close,similarity in zip(closest,similarities):
+      decoded_id = encoded2anime.get(close)
+
+      anime_frame = getAnimeFrame(decoded_id,path_df)
+
+      similarityArr.append(
+          {
+              "anime_id":decoded_id,
+              "anime_name":anime_frame.eng_version.values[0],
+              "genre":anime_frame.Genres.values[0],
+              "similarity":similarity,
+          }
+      )
+
+    Frame = pd.DataFrame(similarityArr).sort_values(by="similarity",ascending=False)
+    return Frame[Frame.anime_id != index].drop(['anime_id'], axis=1)
+
+
+@timed("find_similar_animes")
 def find_similar_animes(name,path_anime_weights,path_anime2anime_encoded,
                         path_encoded2anime,path_df,n=10,return_dist=False,neg=False):
 
   try:
-    anime_weights = joblib.load(path_anime_weights)
-    anime2anime_encoded = joblib.load(path_anime2anime_encoded)
-    encoded2anime = joblib.load(path_encoded2anime)
+    recommender_index = get_recommender_index()
+    anime_weights = recommender_index.get(path_anime_weights)
+    anime2anime_encoded = recommender_index.get(path_anime2anime_encoded)
+    encoded2anime = recommender_index.get(path_encoded2anime)
 
   
     index = getAnimeFrame(name,path_df).MAL_ID.values[0]
@@ -38,17 +85,14 @@ def find_similar_animes(name,path_anime_weights,path_anime2anime_encoded,
     weights = anime_weights
 
 
-    dists = np.dot(weights,weights[encoded_index])
-
-    sorted_dists = np.argsort(dists)
+    dists = similarity_scores(weights,weights[encoded_index])
 
     n = n+1
 
-    if neg:
-      closest = sorted_dists[:n]
-
-    else:
-      closest = sorted_dists[-n:]
+    # top_k returns best first; keep the ascending order argsort used to give
+    closest = top_k(dists,n,largest=not neg)
+    if not neg:
+      closest = closest[::-1]
 
 
     print(f" Anime closest to {name}")
@@ -56,66 +100,126 @@ def find_similar_animes(name,path_anime_weights,path_anime2anime_encoded,
     if return_dist:
       return dists,closest
 
-    similarityArr = []
-
-    for close in closest:
-      decoded_id = encoded2anime.get(close)
-
-      # synopsis = getSypnopsis(decoded_id,synopsis_df)
-
-
-      anime_frame = getAnimeFrame(decoded_id,DF)
-
-      anime_name = anime_frame.eng_version.values[0]
-
-      genre = anime_frame.Genres.values[0]
-
-      similarity = dists[close]
-
-
-      similarityArr.append(
-          {
-              "anime_id":decoded_id,
-              "anime_name":anime_name,
-              "genre":genre,
-              "similarity":similarity,
-          }
-      )
-
-    Frame = pd.DataFrame(similarityArr).sort_values(by="similarity",ascending=False)
-    return Frame[Frame.anime_id != index].drop(['anime_id'], axis=1)
+    return _similar_animes_frame(index,closest,dists[closest],encoded2anime,path_df)
 
   except Exception as e :
     print("Error Occurs ",e)
 
 
+@timed("find_similar_animes_batch")
+def find_similar_animes_batch(names,path_anime_weights,path_anime2anime_encoded,
+                              path_encoded2anime,path_df,n=10,neg=False):
+  '''
+  Same as find_similar_animes for many titles at once. All query vectors are
+  scored with one matrix product.
+
+  returns list : one similarity frame per name (None if the name is unknown)
+  '''
+  recommender_index = get_recommender_index()
+  anime_weights = recommender_index.get(path_anime_weights)
+  anime2anime_encoded = recommender_index.get(path_anime2anime_encoded)
+  encoded2anime = recommender_index.get(path_encoded2anime)
+
+  frames = [None] * len(names)
+  positions,mal_ids,encoded_indices = [],[],[]
+
+  for position,name in enumerate(names):
+    anime_frame = getAnimeFrame(name,path_df)
+    if anime_frame is None or anime_frame.empty:
+      continue
+    mal_id = anime_frame.MAL_ID.values[0]
+    encoded_index = anime2anime_encoded.get(mal_id)
+    if encoded_index is None:
+      continue
+    positions.append(position)
+    mal_ids.append(mal_id)
+    encoded_indices.append(encoded_index)
+
+  if not encoded_indices:
+    return frames
+
+  neighbours = recommender_index.anime_neighbours() if path_anime_weights == ANIME_WEIGHTS_PATH else None
+
+  if neighbours is not None and not neg and n <= neighbours[0].shape[1]:
+    # Precomputed at training time, the query title itself is already excluded
+    closest = neighbours[0][encoded_indices,:n]
+    similarities = neighbours[1][encoded_indices,:n]
+  else:
+    closest,similarities = similarity_top_k(anime_weights,anime_weights[encoded_indices],
+                                            n+1,largest=not neg)
+
+  for row,position in enumerate(positions):
+    frames[position] = _similar_animes_frame(mal_ids[row],closest[row],similarities[row],
+                                             encoded2anime,path_df)
+
+  return frames
+
+
+def get_anime_neighbours(anime_ids,n=10):
+  '''
+  anime_ids : list : MAL ids
+  n : int : neighbours per anime, at most the K the table was built with
+
+  Lookup in the anime -> anime neighbour table built at training time.
+
+  returns (neighbour MAL ids, similarities) each shaped (len(anime_ids), n),
+  best first; rows of anime missing from the model are -1 / nan
+  '''
+  recommender_index = get_recommender_index()
+  neighbours = recommender_index.anime_neighbours()
+  if neighbours is None:
+    raise FileNotFoundError(f"Anime neighbour table not found at {ANIME_NEIGHBOURS_PATH}")
+
+  neighbour_ids,neighbour_similarities = neighbours
+  encoded = recommender_index.get(ANIME2ANIME_ENCODED).encode(anime_ids)
+  decoder = recommender_index.get(ANIME_ENCODED2ANIME).codes
+
+  known = encoded >= 0
+  ids = np.full((len(encoded),n),-1,dtype=np.int64)
+  similarities = np.full((len(encoded),n),np.nan,dtype=np.float32)
+  ids[known] = decoder[neighbour_ids[encoded[known],:n]]
+  similarities[known] = neighbour_similarities[encoded[known],:n]
+  return ids,similarities
+
+
 ##################################4. user recommendation 
 
+@timed("find_similar_users")
 def find_similar_users(item_input,path_user_weights,path_user2user_encoded,
                        path_encoded2user,n=10,return_dist=False,neg=False):
     try:
         
-        user_weights = joblib.load(path_user_weights)
-        user2user_encoded = joblib.load(path_user2user_encoded)
-        encoded2user = joblib.load(path_encoded2user)
+        recommender_index = get_recommender_index()
+        user_weights = recommender_index.get(path_user_weights)
+        user2user_encoded = recommender_index.get(path_user2user_encoded)
+        encoded2user = recommender_index.get(path_encoded2user)
 
         index = item_input
         encoded_index = user2user_encoded.get(index)
         weights = user_weights
-        dists = np.dot(weights,weights[encoded_index])
-        sorted_dists = np.argsort(dists)
-        if neg:
-            closest = sorted_dists[:n]
+
+        ann_index = None if (return_dist or neg) else recommender_index.user_ann_index(path_user_weights)
+
+        if ann_index is not None:
+            # Approximate search over the n_probe closest lists / tables only
+            closest,similarities = search(ann_index,weights[encoded_index],n)
+            found = closest[0] >= 0
+            closest,similarities = closest[0][found][::-1],similarities[0][found][::-1]
+
         else:
-            closest = sorted_dists[-n:]
-        
-        if return_dist:
-            return dists,closest
+            dists = similarity_scores(weights,weights[encoded_index])
+            closest = top_k(dists,n,largest=not neg)
+            if not neg:
+                closest = closest[::-1]
+
+            if return_dist:
+                return dists,closest
+
+            similarities = dists[closest]
         
         similarityArr = []
 
-        for close in closest:
-            similarity = dists[close]
+        for close,similarity in zip(closest,similarities):
 
             if isinstance(item_input,int):
                 decoded_id = encoded2user.get(close)
@@ -134,21 +238,32 @@ def find_similar_users(item_input,path_user_weights,path_user2user_encoded,
 
 ###########################5. Get User Preference
 
-def get_user_preferences(user_id,path_rating_df,path_df):
-    
-    rating_df = pd.read_csv(path_rating_df)
-    df = pd.read_csv(path_df)
-    
+def get_user_preference_ids(user_id,path_rating_df):
+    '''
+    returns np.ndarray : anime ids the user rated at or above their 75th
+    percentile, highest rated first
+    '''
+    recommender_index = get_recommender_index()
 
-    animes_watched_by_user = rating_df[rating_df['user_id']== user_id]
+    if path_rating_df == RATING_DF and recommender_index.has_user_preferences():
+        # O(1) slice of the precomputed CSR preference index
+        return recommender_index.user_preferences(user_id)
+
+    animes_watched_by_user = recommender_index.rows(path_rating_df,'user_id',user_id)
 
     user_rating_percentile = np.percentile(animes_watched_by_user['rating'],75)
 
     animes_watched_by_user = animes_watched_by_user[animes_watched_by_user['rating'] >= user_rating_percentile]
 
-    top_anime_user = (
-        animes_watched_by_user.sort_values(by='rating',ascending=False).anime_id.values
-    )
+    return animes_watched_by_user.sort_values(by='rating',ascending=False).anime_id.values
+
+
+@timed("get_user_preferences")
+def get_user_preferences(user_id,path_rating_df,path_df):
+    
+    df = get_recommender_index().get(path_df)
+
+    top_anime_user = get_user_preference_ids(user_id,path_rating_df)
 
     anime_df_rows = df[df['MAL_ID'].isin(top_anime_user)]
 
@@ -159,50 +274,193 @@ def get_user_preferences(user_id,path_rating_df,path_df):
 
 ######################### 6. User Recommendataion
 
-def get_user_recommendations(similar_users,user_preferences,path_df,path_synopsis_df,path_rating_df,n=10):
-
-    recommended_animes = []
-    anime_list =[]
+@timed("get_user_recommendations")
+def get_user_recommendations(similar_users,user_preferences,path_df,path_synopsis_df,path_rating_df,n=10,
+                             preference_rows=None):
+    '''
+    similar_users : pd.DataFrame : output of find_similar_users
+    user_preferences : pd.DataFrame : output of get_user_preferences (rows of the anime df)
+    preference_rows : dict : optional user_id -> anime df rows cache, shared
+    across calls so batch callers look each similar user up only once
+
+    Votes are counted over anime df row positions, so titles sharing an
+    eng_version are kept apart and only the final top-n rows are joined
+    back to names, genres and synopses.
+    '''
+    recommender_index = get_recommender_index()
+    df = recommender_index.get(path_df)
+    mal_id_to_row = recommender_index.dense_rows(path_df,'MAL_ID')
+
+    # Rows the user already likes are masked out of the vote
+    excluded = df['eng_version'].isna().to_numpy(copy=True)
+    liked_rows = df.index.get_indexer(user_preferences.index)
+    excluded[liked_rows[liked_rows >= 0]] = True
+
+    if preference_rows is None:
+        preference_rows = {}
+
+    voted_rows = []
     for user_id in similar_users['similiar_users'].values:
-        # print("Similar User ID:",user_id)
-        pref_list = get_user_preferences(int(user_id),path_rating_df,path_df)
-
-        pref_list = pref_list[~pref_list['eng_version'].isin(user_preferences['eng_version'].values)]
-       
-
-        if not pref_list.empty:
-            lists = pref_list['eng_version'].values
-            anime_list.append(lists)
-
-                    
-    if anime_list:
-        anime_list = pd.DataFrame(anime_list)
-
-        sorted_list = pd.DataFrame(pd.Series(anime_list.values.ravel()).value_counts()).head(n)
-
-        for i,anime_name in enumerate(sorted_list.index):
-
-            n_user_pref = sorted_list[sorted_list.index == anime_name].values[0][0]
-
-            if isinstance(anime_name,str):
-                frame = getAnimeFrame(anime_name,path_df)
-                
-                anime_id = frame.MAL_ID.values[0]
-              
-                genre = frame.Genres.values[0]
-                synopsis = getSypnopsis(int(anime_id),path_synopsis_df)
-             
-                recommended_animes.append(
-                    {
-                        "n" : n_user_pref,
-                        "anime_name":anime_name,
-                        "genre":genre,
-                        "synopsis":synopsis
-                    }
-                )
-    recommended_animes_df = pd.DataFrame(recommended_animes).head(n)
-    return recommended_animes_df
-
-
-
+        user_id = int(user_id)
+        if user_id not in preference_rows:
+            anime_ids = np.asarray(get_user_preference_ids(user_id,path_rating_df),dtype=np.int64)
+            anime_ids = anime_ids[anime_ids < len(mal_id_to_row)]
+            rows = mal_id_to_row[anime_ids]
+            preference_rows[user_id] = rows[rows >= 0]
+        voted_rows.append(preference_rows[user_id])
+
+    columns = ["n","anime_name","genre","synopsis"]
+    if not voted_rows:
+        return pd.DataFrame(columns=columns)
+
+    votes = np.bincount(np.concatenate(voted_rows),minlength=len(df))
+    votes[excluded] = 0
+
+    # Most votes first, ties keep the anime df order (highest Score first)
+    candidates = np.flatnonzero(votes)
+    top_rows = candidates[np.argsort(-votes[candidates],kind="stable")[:n]]
+
+    top_frame = df.iloc[top_rows]
+    if path_synopsis_df == SYNOPSIS_DF_PATH and recommender_index.has_anime_text():
+        synopses = recommender_index.anime_text(ANIME_SYNOPSIS_TEXT,top_frame['MAL_ID'].values)
+    else:
+        synopses = []
+        for anime_id in top_frame['MAL_ID'].values:
+            synopsis_rows = recommender_index.rows(path_synopsis_df,'MAL_ID',int(anime_id))
+            synopses.append(synopsis_rows['sypnopsis'].values[0] if not synopsis_rows.empty else None)
 
+    recommended_animes = []
+    for n_user_pref,anime_name,genre,synopsis in zip(votes[top_rows],top_frame['eng_version'].values,
+                                                     top_frame['Genres'].values,synopses):
+        recommended_animes.append(
+            {
+                "n" : n_user_pref,
+                "anime_name":anime_name,
+                "genre":genre,
+                "synopsis":synopsis
+            }
+        )
+
+    return pd.DataFrame(recommended_animes,columns=columns)
+
+
+######################### 7. Model Recommendation
+
+@timed("get_model_recommendations")
+def get_model_recommendations(user_ids,path_user_weights,path_anime_weights,path_user2user_encoded,path_df,n=10,
+                              exclude_rated=True):
+    '''
+    user_ids : list : raw user ids
+    n : int : titles per user
+    exclude_rated : bool : leave out every title the user already rated
+
+    Scores the whole catalogue with the NumPy RecommenderNet (normalized
+    embedding dot product, Dense, BatchNorm, sigmoid) for every user in one
+    matrix product, no TensorFlow involved.
+
+    returns pd.DataFrame : columns user_id, rank, anime_id, anime_name, score
+    (score is the predicted scaled rating, users missing from the model get no rows)
+    '''
+    recommender_index = get_recommender_index()
+    user2user_encoded = recommender_index.get(path_user2user_encoded)
+    df = recommender_index.get(path_df)
+
+    known_users = [user_id for user_id in user_ids if user_id in user2user_encoded]
+    columns = {"user_id": [], "rank": [], "anime_id": [], "anime_name": [], "score": []}
+    if not known_users:
+        return pd.DataFrame(columns)
+
+    encoded_users = [user2user_encoded[user_id] for user_id in known_users]
+
+    # Only titles with a name in the anime df can be recommended, as in the hybrid path
+    anime_rows = recommender_index.anime_rows()
+    allowed = anime_rows >= 0
+    allowed[allowed] = df['eng_version'].notna().to_numpy()[anime_rows[allowed]]
+
+    history = None
+    if exclude_rated and recommender_index.has_user_history():
+        history = recommender_index.user_history(encoded_users)
+    elif exclude_rated:
+        # No full history in older artifacts, fall back to the top rated titles
+        anime2anime_encoded = recommender_index.get(ANIME2ANIME_ENCODED)
+        history = [anime2anime_encoded.encode(get_user_preference_ids(user_id,RATING_DF)) for user_id in known_users]
+        history = [encoded[encoded >= 0] for encoded in history]
+
+    encoded_anime,ratings = score_catalogue(recommender_index.get(path_user_weights)[encoded_users],
+                                            recommender_index.get(path_anime_weights),
+                                            recommender_index.scoring_head(),n,history=history,allowed=allowed)
+
+    mal_ids = df['MAL_ID'].to_numpy()
+    names = df['eng_version'].to_numpy()
+    for user_id,user_anime,user_ratings in zip(known_users,encoded_anime,ratings):
+        keep = ~np.isnan(user_ratings)
+        rows = anime_rows[user_anime[keep]]
+        columns["user_id"].extend([user_id] * len(rows))
+        columns["rank"].extend(range(1,len(rows) + 1))
+        columns["anime_id"].extend(mal_ids[rows].tolist())
+        columns["anime_name"].extend(names[rows].tolist())
+        columns["score"].extend(user_ratings[keep].tolist())
+
+    return pd.DataFrame(columns)
+
+
+######################### 8. Popularity Fallback
+
+def is_cold_start_user(user_id,path_user2user_encoded,min_ratings=5):
+    '''
+    True for users the model does not know, or who rated fewer than
+    min_ratings titles. Only reads the encoder and the history offsets, so
+    it runs before any similarity search.
+    '''
+    recommender_index = get_recommender_index()
+    encoded_index = recommender_index.get(path_user2user_encoded).get(user_id)
+    if encoded_index is None:
+        return True
+    if min_ratings and recommender_index.has_user_history():
+        return recommender_index.user_history_length(encoded_index) < min_ratings
+    return False
+
+
+@timed("get_popular_animes")
+def get_popular_animes(user_id,path_user2user_encoded,path_df,n=10,genre=None):
+    '''
+    genre : str : rank within this genre, by default the genre the user
+    rated most (if they rated anything)
+
+    Titles come from the precomputed popularity ranking, minus the ones the
+    user already rated, topped up from the overall ranking when the genre
+    runs short.
+
+    returns pd.DataFrame : columns anime_id, anime_name, score (weighted score)
+    '''
+    recommender_index = get_recommender_index()
+    ranking = recommender_index.popularity()
+
+    rated_ids = set()
+    encoded_index = recommender_index.get(path_user2user_encoded).get(user_id)
+    if encoded_index is not None and recommender_index.has_user_history():
+        encoded_anime = recommender_index.user_history([encoded_index])[0]
+        rated_ids = set(recommender_index.get(ANIME_ENCODED2ANIME).codes[encoded_anime].tolist())
+        if genre is None and rated_ids:
+            rows = recommender_index.dense_rows(path_df,'MAL_ID')
+            rated_rows = [rows[anime_id] for anime_id in rated_ids if anime_id < len(rows) and rows[anime_id] >= 0]
+            genres = Counter(genre_name for genres in recommender_index.get(path_df)['Genres'].iloc[rated_rows].dropna()
+                             for genre_name in genres.split(", "))
+            genre = genres.most_common(1)[0][0] if genres else None
+
+    columns = {"anime_id": [], "anime_name": [], "score": []}
+    seen = set(rated_ids)
+    for entries in (ranking['by_genre'].get(genre), ranking['overall']):
+        if entries is None:
+            continue
+        for anime_id,anime_name,score in zip(entries['anime_id'],entries['anime_name'],entries['weighted_score']):
+            if len(columns["anime_id"]) == n:
+                break
+            if anime_id in seen:
+                continue
+            seen.add(anime_id)
+            columns["anime_id"].append(anime_id)
+            columns["anime_name"].append(anime_name)
+            columns["score"].append(score)
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,169 @@
+import time
+import bisect
+import functools
+import threading
+from src.logger import get_logger
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+# Latency buckets in seconds, 1ms .. 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        # Copied under the lock, a request thread may add a series mid render
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge(Counter):
+
+    kind = "gauge"
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value):
+        # Non-cumulative bucket counts; the cumulative sums are built on render
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        # Series are updated in place, so copy the bucket counts too
+        with self._lock:
+            series = sorted((label_values, (list(counts), total, count))
+                            for label_values, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, [f'le="{bound}"'])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {count}"
+
+
+class MetricsRegistry:
+    '''
+    In-process metrics, rendered in the Prometheus text format. Each gunicorn
+    worker keeps its own registry, so a scrape reports the worker serving it.
+    '''
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._enabled = None
+
+    @property
+    def enabled(self):
+        if self._enabled is None:
+            try:
+                from utils.recommender_index import get_recommender_index
+                self._enabled = bool(get_recommender_index().config.get('metrics', {}).get('enabled', True))
+            except Exception as e:
+                logger.warning(f"Could not read the metrics switch, metrics stay enabled: {e}")
+                self._enabled = True
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collector):
+        # Called on every render to refresh gauges fed from elsewhere (e.g. cache stats)
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "recommender_stage_seconds", "Time spent in each recommendation stage", labels=("stage",))
+ARTIFACT_LOAD_SECONDS = registry.gauge(
+    "recommender_artifact_load_seconds", "Time taken to load each serving artifact", labels=("artifact",))
+
+
+def timed(stage):
+    '''
+    Decorator recording the wall time of every call under the given stage.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(stage, value=time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,62 @@
+import json
+import numpy as np
+from utils.quantization import similarity_scores
+from utils.topk import top_k
+
+
+class ScoringHead:
+    '''
+    NumPy version of everything RecommenderNet does after the normalized
+    dot product: Dense(1) -> BatchNormalization (inference) -> sigmoid.
+
+    Dense and BatchNorm fold into one affine map of the cosine similarity,
+    so a rating is sigmoid(slope * cosine + intercept).
+    '''
+
+    def __init__(self, dense_kernel=1.0, dense_bias=0.0, bn_gamma=1.0, bn_beta=0.0,
+                 bn_moving_mean=0.0, bn_moving_variance=1.0, bn_epsilon=1e-3):
+        scale = bn_gamma / np.sqrt(bn_moving_variance + bn_epsilon)
+        self.slope = float(dense_kernel * scale)
+        self.intercept = float((dense_bias - bn_moving_mean) * scale + bn_beta)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as scoring_head_file:
+            return cls(**json.load(scoring_head_file))
+
+    def __call__(self, cosine):
+        # Predicted rating in [0, 1], the scale the model was trained on
+        return 1 / (1 + np.exp(-(self.slope * np.asarray(cosine, dtype=np.float32) + self.intercept)))
+
+
+def score_catalogue(user_rows, anime_weights, head, k, history=None, allowed=None):
+    '''
+    user_rows : np.ndarray : (n_users, dim) normalized user embeddings
+    anime_weights : np.ndarray | QuantizedTable : (n_anime, dim) normalized anime embeddings
+    head : ScoringHead : dense / batch norm parameters
+    k : int : titles to return per user
+    history : list : per user, encoded anime ids to leave out (already rated)
+    allowed : np.ndarray : bool mask over encoded anime that may be recommended
+
+    Scores every anime for every user with one matrix product. The head is
+    monotonic in the cosine, so ranking and partial selection work on the
+    raw similarities and the sigmoid only runs on the k survivors.
+
+    returns (encoded anime, predicted ratings) each shaped (n_users, k), best first
+    '''
+    cosine = similarity_scores(anime_weights, np.atleast_2d(user_rows))
+    ranking = cosine if head.slope >= 0 else -cosine
+
+    if allowed is not None:
+        ranking[:, ~allowed] = -np.inf
+    if history is not None:
+        lengths = [len(rated) for rated in history]
+        if sum(lengths):
+            rows = np.repeat(np.arange(len(history)), lengths)
+            ranking[rows, np.concatenate(history).astype(np.intp)] = -np.inf
+
+    encoded_anime = top_k(ranking, k)
+    ratings = head(np.take_along_axis(cosine, encoded_anime, axis=-1))
+    # Users with fewer than k unmasked titles get NaN ratings in the tail
+    ratings[np.isneginf(np.take_along_axis(ranking, encoded_anime, axis=-1))] = np.nan
+    return encoded_anime, ratings
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+
+def popularity_ranking(anime_df, top_n=100, members_quantile=0.75):
+    '''
+    anime_df : pd.DataFrame : processed anime df (MAL_ID, eng_version, Score, Genres, Members)
+    top_n : int : titles kept overall and per genre
+    members_quantile : float : Members count (as a quantile) at which a title's
+    own Score and the catalogue mean Score weigh equally
+
+    Ranks titles by the Bayesian weighted score
+        members / (members + m) * score + m / (members + m) * mean_score
+    so a high Score backed by few members does not beat a slightly lower
+    Score backed by a large audience.
+
+    returns dict : {"overall": entries, "by_genre": {genre: entries}} where
+    entries holds parallel anime_id / anime_name / weighted_score lists
+    '''
+    df = anime_df[['MAL_ID', 'eng_version', 'Score', 'Genres', 'Members']].copy()
+    df['Score'] = pd.to_numeric(df['Score'], errors='coerce')
+    df['Members'] = pd.to_numeric(df['Members'], errors='coerce')
+    df = df.dropna(subset=['Score', 'Members', 'eng_version'])
+
+    mean_score = df['Score'].mean()
+    m = df['Members'].quantile(members_quantile)
+    members = df['Members'].to_numpy(dtype=np.float64)
+    df['weighted_score'] = members / (members + m) * df['Score'] + m / (members + m) * mean_score
+    df = df.sort_values('weighted_score', ascending=False, kind='stable')
+
+    def entries(frame):
+        frame = frame.head(top_n)
+        return {
+            "anime_id": frame['MAL_ID'].astype(np.int64).tolist(),
+            "anime_name": frame['eng_version'].tolist(),
+            "weighted_score": frame['weighted_score'].round(4).tolist(),
+        }
+
+    genres = df.assign(genre=df['Genres'].astype(object).fillna("").str.split(", ")).explode('genre')
+    genres = genres[genres['genre'] != ""]
+    return {
+        "overall": entries(df),
+        "by_genre": {genre: entries(frame) for genre, frame in genres.groupby('genre', sort=True)},
+    }
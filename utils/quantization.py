@@ -0,0 +1,98 @@
+import os
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+
+# Rows upcast per block when scoring: 1 MB of float32 at dim 128, so the block
+# is still in L2 when the matmul reads it back
+BLOCK_ROWS = 2048
+
+
+class QuantizedTable:
+    '''
+    Embedding table kept as float16, or int8 with one float32 scale per row.
+    Only BLOCK_ROWS rows are ever upcast to float32 at a time.
+
+    A memory-only mode: NumPy has no BLAS path for int8 or float16, so every
+    query pays the upcast and scores slower than a float32 table (see
+    benchmarks/quantization_report.py). Serving defaults to float32.
+    '''
+
+    def __init__(self, codes, scales=None):
+        self.codes = codes
+        self.scales = scales
+        self.precision = str(codes.dtype)
+
+    @classmethod
+    def quantize(cls, weights, precision):
+        weights = np.asarray(weights, dtype=np.float32)
+        if precision == "float16":
+            return cls(weights.astype(np.float16))
+        if precision == "int8":
+            scales = np.abs(weights).max(axis=1) / 127
+            scales[scales == 0] = 1
+            codes = np.clip(np.rint(weights / scales[:, None]), -127, 127).astype(np.int8)
+            return cls(codes, scales.astype(np.float32))
+        raise ValueError(f"Unsupported embedding precision {precision}")
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        # Dequantized float32 rows
+        rows = np.asarray(self.codes[index], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * np.asarray(self.scales[index], dtype=np.float32)[..., None]
+        return rows
+
+    def scores(self, queries):
+        '''
+        queries : np.ndarray : (dim,) or (n_queries, dim) float32
+
+        returns np.ndarray : (n_items,) or (n_queries, n_items) dot products
+        '''
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        # One scratch block per call (tables are shared between threads),
+        # reused so the upcast never allocates
+        scratch = np.empty((min(BLOCK_ROWS, len(self.codes)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, len(self.codes))
+            block = scratch[:end - start]
+            np.copyto(block, self.codes[start:end])
+            np.matmul(queries, block.T, out=scores[:, start:end])
+            if self.scales is not None:
+                scores[:, start:end] *= self.scales[start:end]
+
+        return scores[0] if single else scores
+
+
+def quantized_paths(path, precision):
+    '''
+    returns (codes_path, scales_path) of the quantized copy of a weights .npy
+    '''
+    base = os.path.splitext(path)[0]
+    return f"{base}_{precision}.npy", f"{base}_{precision}_scales.npy"
+
+
+def similarity_scores(weights, queries):
+    '''
+    Dot products of queries against a float table or a QuantizedTable.
+    '''
+    if isinstance(weights, QuantizedTable):
+        return weights.scores(queries)
+    queries = np.asarray(queries)
+    if queries.ndim == 1:
+        return np.dot(weights, queries)
+    return queries @ weights.T
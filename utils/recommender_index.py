@@ -0,0 +1,422 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from src.logger import get_logger
+from src.custom_exception import CustomException
+from utils.common_function import read_yaml
+from utils.ann_index import load_ann_index
+from utils.artifact_store import current_release, release_dir, release_path, verify_release, artifacts_version
+from utils.array_store import load_array, DenseEncoder
+from utils.columnar import has_columns, load_frame
+from utils.quantization import QuantizedTable, quantized_paths
+from utils.metrics import ARTIFACT_LOAD_SECONDS
+from utils.model_scoring import ScoringHead
+from utils.popularity import popularity_ranking
+from utils.title_index import TitleIndex
+from utils.text_store import TextStore
+from config.paths_config import *
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+
+class RecommenderIndex:
+    '''
+    Process wide, in-memory holder of every serving artifact.
+
+    Artifacts are keyed by their path so the helpers can keep taking paths
+    while only ever reading each artifact from disk once. With a published
+    release the same paths are read from artifacts/releases/<version>/.
+    '''
+
+    WEIGHT_PATHS = [ANIME_WEIGHTS_PATH, USER_WEIGHTS_PATH]
+    ENCODER_PATHS = [USER2USER_ENCODED, USER_ENCODED2USER, ANIME2ANIME_ENCODED, ANIME_ENCODED2ANIME]
+    CSV_PATHS = [DF, SYNOPSIS_DF_PATH, RATING_DF]
+    USER_PREF_PATHS = [USER_PREF_OFFSETS, USER_PREF_ANIME]
+    NEIGHBOUR_PATHS = [ANIME_NEIGHBOURS_PATH, ANIME_NEIGHBOUR_SIMILARITY_PATH]
+    HISTORY_PATHS = [USER_HISTORY_OFFSETS, USER_HISTORY_ANIME]
+    # Row MAL_IDs first, then the stores they key
+    TEXT_PATHS = [ANIME_TEXT_IDS, ANIME_NAME_TEXT, ANIME_GENRES_TEXT, ANIME_SYNOPSIS_TEXT]
+    # Repeated metadata strings, stored once per distinct value
+    CATEGORICAL_COLUMNS = {DF: ["Genres", "Type", "Studios"]}
+
+    def __init__(self, root=ARTIFACTS_DIR, version=None):
+        '''
+        root : str : artifacts directory, or a release directory
+        version : str : release version, None for the unversioned working copy
+        '''
+        self.root = root
+        self.version = version
+        self._cache_version = version
+        self._artifacts = {}
+        self._lookups = {}
+        self._config = None
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    @classmethod
+    def for_release(cls, version):
+        verify_release(version)
+        return cls(release_dir(version), version)
+
+    @classmethod
+    def for_current_release(cls):
+        # Falls back to the unversioned artifacts/ layout when nothing is published
+        version = current_release()
+        return cls.for_release(version) if version else cls()
+
+    def path_of(self, path):
+        return release_path(self.root, path)
+
+    def load(self):
+        # Eagerly read every serving artifact so no request pays a cold load,
+        # fingerprinting the working copy before anything is read
+        self.cache_version
+        paths = self.WEIGHT_PATHS + self.ENCODER_PATHS + self.CSV_PATHS
+        if self.has_user_preferences():
+            # The CSR preference index replaces the full rating_df scan
+            paths = [path for path in paths if path != RATING_DF] + self.USER_PREF_PATHS
+        if self.has_anime_neighbours():
+            paths = paths + self.NEIGHBOUR_PATHS
+        if self.has_user_history():
+            paths = paths + self.HISTORY_PATHS
+        if self.has_anime_text():
+            # Memory-mapped text stores replace parsing the whole synopsis csv
+            paths = [path for path in paths if path != SYNOPSIS_DF_PATH] + self.TEXT_PATHS
+        for path in paths:
+            self.get(path)
+        self.user_ann_index(USER_WEIGHTS_PATH)
+        self.popularity()
+        self.title_index()
+        self.loaded = True
+        logger.info(f"Recommender index loaded all serving artifacts from {self.root}.")
+        return self
+
+    def _read(self, path):
+        location = self.path_of(path)
+        if path == RATING_DF and has_columns(self.path_of(RATING_COLUMNS)):
+            # Memory-mapped columns instead of parsing the csv
+            return load_frame(self.path_of(RATING_COLUMNS))
+        if path.endswith(".csv"):
+            return pd.read_csv(location, dtype={column: "category" for column in self.CATEGORICAL_COLUMNS.get(path, [])})
+        if path.endswith(".bin"):
+            return TextStore.load(location)
+        if path in self.WEIGHT_PATHS and self.embedding_precision != "float32":
+            return self._read_quantized(location, self.embedding_precision)
+        if path.endswith(".npy"):
+            # Memory-mapped, so worker processes share one page-cached copy
+            array = load_array(location, mmap_mode="r")
+            return DenseEncoder(array) if path in self.ENCODER_PATHS else array
+        # Never unpickle on the serving side, pre-release layouts must be rebuilt
+        raise CustomException(f"Unsupported artifact format {location}, expected .npy, .csv or .bin")
+
+    def _read_quantized(self, path, precision):
+        codes_path, scales_path = quantized_paths(path, precision)
+        if os.path.exists(codes_path):
+            scales = load_array(scales_path) if precision == "int8" else None
+            return QuantizedTable(load_array(codes_path), scales)
+        # Older artifacts without a quantized copy are quantized in process
+        logger.info(f"No {precision} copy of {path}, quantizing at load time.")
+        return QuantizedTable.quantize(load_array(path), precision)
+
+    @property
+    def embedding_precision(self):
+        return self.config.get('serving', {}).get('embedding_precision', "float32")
+
+    def get(self, path):
+        try:
+            return self._artifacts[path]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if path not in self._artifacts:
+                start = time.perf_counter()
+                self._artifacts[path] = self._read(path)
+                load_seconds = time.perf_counter() - start
+                ARTIFACT_LOAD_SECONDS.set(os.path.basename(path), value=load_seconds)
+                logger.info(f"Loaded artifact {path} into recommender index in {load_seconds:.3f}s.")
+            return self._artifacts[path]
+
+    def _memo(self, key, build):
+        # Derived structures are built once, under the lock, on first use
+        try:
+            return self._lookups[key]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if key not in self._lookups:
+                self._lookups[key] = build()
+            return self._lookups[key]
+
+    @property
+    def cache_version(self):
+        '''
+        returns str : what results computed from this index are cached under,
+        the release version or, for the working copy, a fingerprint of the
+        files taken before the first read (the index never reloads them)
+        '''
+        if self._cache_version is None:
+            with self._lock:
+                if self._cache_version is None:
+                    self._cache_version = artifacts_version((self.path_of(WEIGHTS_DIR), self.path_of(PROCESSED_DIR)))
+        return self._cache_version
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = read_yaml(CONFIG_PATH)
+        return self._config
+
+    def lookup(self, path, column):
+        '''
+        path : str : csv artifact path
+        column : str : column to index
+
+        returns dict : value -> array of row positions in the dataframe
+        '''
+        return self._memo((path, column), lambda: self.get(path).groupby(column, sort=False).indices)
+
+    def dense_rows(self, path, column):
+        '''
+        path : str : csv artifact path
+        column : str : non-negative integer id column (e.g. MAL_ID)
+
+        returns np.ndarray : int32 array where entry id is the row position of
+        that id in the dataframe, -1 when the id is absent
+        '''
+        def build():
+            ids = self.get(path)[column].to_numpy(dtype=np.int64)
+            dense = np.full(ids.max() + 1 if len(ids) else 0, -1, dtype=np.int32)
+            # Assign in reverse so the first row wins for duplicated ids
+            dense[ids[::-1]] = np.arange(len(ids) - 1, -1, -1, dtype=np.int32)
+            return dense
+
+        return self._memo((path, column, "dense"), build)
+
+    def rows(self, path, column, value):
+        df = self.get(path)
+        positions = self.lookup(path, column).get(value)
+        if positions is None:
+            return df.iloc[0:0]
+        return df.iloc[positions]
+
+    def has_user_preferences(self):
+        return all(path in self._artifacts or os.path.exists(self.path_of(path)) for path in self.USER_PREF_PATHS)
+
+    def user_preferences(self, user_id):
+        '''
+        user_id : int : raw user id
+
+        returns np.ndarray : anime ids the user rated at or above their 75th
+        percentile, highest rated first (empty for unknown users)
+        '''
+        encoded_index = self.get(USER2USER_ENCODED).get(user_id)
+        if encoded_index is None:
+            return np.empty(0, dtype=np.int32)
+        offsets = self.get(USER_PREF_OFFSETS)
+        return self.get(USER_PREF_ANIME)[offsets[encoded_index]:offsets[encoded_index + 1]]
+
+    def has_user_history(self):
+        return all(path in self._artifacts or os.path.exists(self.path_of(path)) for path in self.HISTORY_PATHS)
+
+    def user_history(self, encoded_users):
+        '''
+        encoded_users : list : encoded user ids
+
+        returns list : per user, every encoded anime id they rated
+        '''
+        offsets = self.get(USER_HISTORY_OFFSETS)
+        history = self.get(USER_HISTORY_ANIME)
+        return [history[offsets[user]:offsets[user + 1]] for user in encoded_users]
+
+    def user_history_length(self, encoded_user):
+        offsets = self.get(USER_HISTORY_OFFSETS)
+        return int(offsets[encoded_user + 1] - offsets[encoded_user])
+
+    def popularity(self):
+        '''
+        returns dict : popularity ranking written by process_anime_data,
+        computed from the anime df for older artifacts without it
+        '''
+        def build():
+            if os.path.exists(self.path_of(POPULARITY_PATH)):
+                with open(self.path_of(POPULARITY_PATH)) as popularity_file:
+                    return json.load(popularity_file)
+            logger.info(f"No {POPULARITY_PATH}, ranking popularity from {DF}.")
+            popularity_config = self.config.get('popularity', {})
+            return popularity_ranking(self.anime_df, top_n=popularity_config.get('top_n', 100),
+                                      members_quantile=popularity_config.get('members_quantile', 0.75))
+
+        return self._memo(POPULARITY_PATH, build)
+
+    def scoring_head(self):
+        def build():
+            if os.path.exists(self.path_of(SCORING_HEAD_PATH)):
+                return ScoringHead.load(self.path_of(SCORING_HEAD_PATH))
+            # Older artifacts: identity head, ranking by plain cosine similarity
+            logger.warning(f"No {SCORING_HEAD_PATH}, model scores are sigmoid(cosine similarity).")
+            return ScoringHead()
+
+        return self._memo(SCORING_HEAD_PATH, build)
+
+    def anime_rows(self):
+        '''
+        returns np.ndarray : int32 row of every encoded anime in the anime
+        dataframe, -1 for anime without metadata
+        '''
+        def build():
+            anime_ids = self.get(ANIME_ENCODED2ANIME).codes
+            dense = self.dense_rows(DF, "MAL_ID")
+            rows = np.full(len(anime_ids), -1, dtype=np.int32)
+            known = (anime_ids >= 0) & (anime_ids < len(dense))
+            rows[known] = dense[anime_ids[known]]
+            return rows
+
+        return self._memo((ANIME_ENCODED2ANIME, DF, "rows"), build)
+
+    def has_anime_text(self):
+        return all(path in self._artifacts or os.path.exists(self.path_of(path)) for path in self.TEXT_PATHS)
+
+    def anime_text(self, path, anime_ids):
+        '''
+        path : str : one of the .bin TEXT_PATHS
+        anime_ids : list : MAL_IDs
+
+        returns list : decoded value per MAL_ID, None for anime without one
+        '''
+        text_ids = self.get(ANIME_TEXT_IDS)
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        rows = np.searchsorted(text_ids, anime_ids)
+        found = rows < len(text_ids)
+        found[found] = text_ids[rows[found]] == anime_ids[found]
+        return self.get(path).take(np.where(found, rows, -1))
+
+    def title_index(self):
+        '''
+        returns TitleIndex : exact, prefix and fuzzy title lookups over the
+        anime and synopsis dataframes
+        '''
+        def build():
+            if not self.has_anime_text():
+                return TitleIndex(self.anime_df, self.synopsis_df)
+            names = self.get(ANIME_NAME_TEXT)
+            aliases = pd.DataFrame({"MAL_ID": self.get(ANIME_TEXT_IDS),
+                                    "Name": names.take(range(len(names)))})
+            return TitleIndex(self.anime_df, aliases)
+
+        return self._memo((DF, SYNOPSIS_DF_PATH, "titles"), build)
+
+    def derive(self, overrides):
+        '''
+        overrides : dict : artifact path -> replacement artifact
+
+        returns a new index sharing every artifact loaded so far, with the
+        overrides swapped in (e.g. a holdout copy for offline evaluation)
+        '''
+        derived = RecommenderIndex(self.root, self.version)
+        derived._config = self._config
+        derived._artifacts = {**self._artifacts, **overrides}
+        derived.loaded = self.loaded
+        return derived
+
+    def has_anime_neighbours(self):
+        return all(path in self._artifacts or os.path.exists(self.path_of(path)) for path in self.NEIGHBOUR_PATHS)
+
+    def anime_neighbours(self):
+        '''
+        returns (neighbours, similarities) : (n_anime, K) tables over encoded
+        anime ids, best first, built at training time (None if missing)
+        '''
+        if not self.has_anime_neighbours():
+            return None
+        return self.get(ANIME_NEIGHBOURS_PATH), self.get(ANIME_NEIGHBOUR_SIMILARITY_PATH)
+
+    def user_ann_index(self, path_user_weights):
+        '''
+        returns the user ann index when ann.use_for_serving is enabled and the
+        index was built for these weights, otherwise None
+        '''
+        ann_config = self.config.get('ann', {})
+        if not ann_config.get('use_for_serving') or path_user_weights != USER_WEIGHTS_PATH:
+            return None
+        if not os.path.exists(self.path_of(USER_ANN_INDEX_PATH)):
+            return None
+        return self._memo((USER_ANN_INDEX_PATH, "ann"),
+                          lambda: load_ann_index(self.path_of(USER_ANN_INDEX_PATH), self.get(path_user_weights)))
+
+    @property
+    def anime_weights(self):
+        return self.get(ANIME_WEIGHTS_PATH)
+
+    @property
+    def user_weights(self):
+        return self.get(USER_WEIGHTS_PATH)
+
+    @property
+    def anime_df(self):
+        return self.get(DF)
+
+    @property
+    def synopsis_df(self):
+        return self.get(SYNOPSIS_DF_PATH)
+
+    @property
+    def rating_df(self):
+        return self.get(RATING_DF)
+
+
+_recommender_index = None
+_recommender_index_lock = threading.Lock()
+# Index a request started with, so a release swap never changes it mid-request
+_pinned_index = contextvars.ContextVar("pinned_recommender_index", default=None)
+
+
+def get_recommender_index():
+    global _recommender_index
+    pinned = _pinned_index.get()
+    if pinned is not None:
+        return pinned
+    if _recommender_index is None:
+        with _recommender_index_lock:
+            if _recommender_index is None:
+                _recommender_index = RecommenderIndex.for_current_release()
+    return _recommender_index
+
+
+def swap_recommender_index(recommender_index):
+    '''
+    Makes an already loaded index the one new requests get. Requests pinned
+    to the previous index keep it alive until they finish.
+
+    returns the previous index
+    '''
+    global _recommender_index
+    with _recommender_index_lock:
+        previous, _recommender_index = _recommender_index, recommender_index
+    logger.info(f"Recommender index swapped from {getattr(previous, 'version', None)} to {recommender_index.version}.")
+    return previous
+
+
+def pin_recommender_index(recommender_index=None):
+    # returns a token for unpin_recommender_index
+    return _pinned_index.set(recommender_index or get_recommender_index())
+
+
+def unpin_recommender_index(token):
+    _pinned_index.reset(token)
+
+
+@contextmanager
+def pinned_recommender_index(recommender_index=None):
+    token = pin_recommender_index(recommender_index)
+    try:
+        yield _pinned_index.get()
+    finally:
+        unpin_recommender_index(token)
@@ -0,0 +1,91 @@
+import os
+import threading
+from src.logger import get_logger
+from utils.artifact_store import current_release
+from utils.recommender_index import RecommenderIndex, get_recommender_index, pinned_recommender_index, swap_recommender_index
+from utils.result_cache import get_result_cache
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+
+class ReleaseWatcher:
+    '''
+    Background thread polling releases/CURRENT. A new version is loaded and
+    warmed up next to the serving one, then swapped in between requests;
+    in-flight requests finish on the index they were pinned to.
+    '''
+
+    def __init__(self, poll_seconds=10, warm_up=None, on_swap=None):
+        '''
+        poll_seconds : float : how often CURRENT is read
+        warm_up : callable : run with the new index pinned, before the swap
+        on_swap : callable : called with the new index after the swap
+        '''
+        self.poll_seconds = poll_seconds
+        self.warm_up = warm_up
+        self.on_swap = on_swap
+        self._failed = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="release-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"Watching {current_release() or 'unversioned artifacts'} for new releases every {self.poll_seconds}s.")
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        '''
+        returns bool : True when a new release was swapped in
+        '''
+        version = current_release()
+        if version is None or version == get_recommender_index().version or version in self._failed:
+            return False
+
+        try:
+            recommender_index = RecommenderIndex.for_release(version).load()
+            if self.warm_up is not None:
+                with pinned_recommender_index(recommender_index):
+                    self.warm_up()
+        except Exception as e:
+            # Keep serving the current version and do not retry a broken release
+            self._failed.add(version)
+            logger.exception(f"Release {version} failed to load, still serving {get_recommender_index().version}: {e}")
+            return False
+
+        swap_recommender_index(recommender_index)
+        get_result_cache().invalidate(version)
+        if self.on_swap is not None:
+            self.on_swap(recommender_index)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception(f"Release check failed: {e}")
+
+
+_watcher = None
+_watcher_pid = None
+_watcher_lock = threading.Lock()
+
+
+def ensure_release_watcher(poll_seconds=10, warm_up=None, on_swap=None):
+    '''
+    Starts the watcher once per process. Threads do not survive fork, so a
+    gunicorn worker starts its own on its first request.
+    '''
+    global _watcher, _watcher_pid
+    if not poll_seconds:
+        return None
+    if _watcher is None or _watcher_pid != os.getpid():
+        with _watcher_lock:
+            if _watcher is None or _watcher_pid != os.getpid():
+                _watcher = ReleaseWatcher(poll_seconds, warm_up, on_swap).start()
+                _watcher_pid = os.getpid()
+    return _watcher
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from src.logger import get_logger
+from utils.recommender_index import get_recommender_index
+from config.paths_config import *
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+_MISSING = object()
+
+
+class ResultCache:
+    '''
+    Base class for the result caches: hit / miss accounting and the
+    model-version keying shared by every backend.
+    '''
+
+    def __init__(self, max_entries=10000, ttl_seconds=0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_version(self):
+        # What the serving index actually holds, never what is on disk now:
+        # results are only ever computed from that index (the release
+        # watcher invalidates on a swap)
+        self._version = get_recommender_index().cache_version
+        return self._version
+
+    def _expired(self, created):
+        return bool(self.ttl_seconds) and time.time() - created > self.ttl_seconds
+
+    def get_or_compute(self, key, compute):
+        '''
+        key : tuple : request parameters, the model version is appended
+        compute : callable : produces a json serializable result on a miss
+        '''
+        full_key = json.dumps(list(key) + [self.model_version])
+
+        value = self._get(full_key)
+        if value is not _MISSING:
+            self._count("hits")
+            return value
+
+        self._count("misses")
+        value = compute()
+        # Results cut short by a deadline are served but not cached
+        if not getattr(value, "partial", False):
+            self._set(full_key, value)
+        return value
+
+    def _count(self, stat, amount=1):
+        # Threads share the cache, += on the counters is not atomic
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + amount)
+
+    def stats(self):
+        with self._lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        lookups = hits + misses
+        return {
+            "backend": self.backend,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "model_version": self._version,
+        }
+
+
+class NullCache(ResultCache):
+    backend = "none"
+
+    def get_or_compute(self, key, compute):
+        self._count("misses")
+        return compute()
+
+    def invalidate(self, version=None):
+        pass
+
+
+class MemoryCache(ResultCache):
+    '''
+    In-process LRU cache with optional TTL.
+    '''
+
+    backend = "memory"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            created, value = entry
+            if self._expired(created):
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, version=None):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(ResultCache):
+    '''
+    On-disk LRU cache shared by every server process / replica that mounts
+    the same file. Values are stored as json.
+    '''
+
+    backend = "sqlite"
+
+    def __init__(self, path=RESULT_CACHE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, version TEXT, value TEXT, created REAL, accessed REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the cache safe across threads and forks
+        connection = sqlite3.connect(self.path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _get(self, key):
+        with self._connect() as connection:
+            row = connection.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return _MISSING
+            value, created = row
+            if self._expired(created):
+                connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                return _MISSING
+            connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            return json.loads(value)
+
+    def _set(self, key, value):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results (key, version, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, self._version, json.dumps(value), now, now),
+            )
+            overflow = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                connection.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                    (overflow,),
+                )
+                self._count("evictions", overflow)
+
+    def invalidate(self, version=None):
+        with self._connect() as connection:
+            if version is None:
+                connection.execute("DELETE FROM results")
+            else:
+                connection.execute("DELETE FROM results WHERE version != ?", (version,))
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+RESULT_CACHES = {NullCache.backend: NullCache, MemoryCache.backend: MemoryCache, SQLiteCache.backend: SQLiteCache}
+
+
+def build_result_cache(config):
+    '''
+    config : dict : the cache section of config.yaml
+    '''
+    cache_class = RESULT_CACHES[config.get('backend', 'memory')]
+    if cache_class is NullCache:
+        return NullCache()
+    return cache_class(
+        max_entries=config.get('max_entries', 10000),
+        ttl_seconds=config.get('ttl_seconds', 0),
+    )
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = build_result_cache(get_recommender_index().config.get('cache', {}))
+                logger.info(f"Result cache initialized with backend {_result_cache.backend}.")
+    return _result_cache
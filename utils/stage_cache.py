@@ -0,0 +1,134 @@
+'''
+Skips training pipeline stages whose inputs did not change.
+
+A stage's fingerprint is a sha256 over
+  inputs   size and mtime (or sha256 with hash_inputs) of every input file
+  config   the config.yaml sections the stage reads
+  code     sha256 of the source of the modules the stage runs
+and its record under artifacts/stages/<stage>.json keeps the fingerprint
+of the last successful run with the state of every output file. A stage is
+skipped when the fingerprint matches and its outputs are still exactly
+what that run wrote; any edit, missing output or --force reruns it.
+Downstream stages list upstream outputs as inputs, so a rerun cascades.
+'''
+import os
+import json
+import hashlib
+import importlib.util
+from datetime import datetime, timezone
+from src.logger import get_logger
+from config.paths_config import *
+
+# Initialize Logger
+logger = get_logger(__name__)
+
+
+class Stage:
+    '''
+    name : str : stage name, also the record file name
+    inputs : list : files or directories the stage reads
+    outputs : list : files or directories the stage writes
+    config_keys : list : config.yaml sections the stage reads
+    code : list : modules (e.g. "src.model_training") whose source changes invalidate the stage
+    '''
+
+    def __init__(self, name, inputs, outputs, config_keys, code):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.config_keys = config_keys
+        self.code = code
+
+    @property
+    def record_path(self):
+        return os.path.join(STAGE_CACHE_DIR, f"{self.name}.json")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as stage_file:
+        for block in iter(lambda: stage_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_state(paths, hash_files=False):
+    '''
+    paths : list : files or directories (walked recursively)
+
+    returns dict : file path -> [size, mtime_ns] (or sha256), None for a
+    missing path
+    '''
+    state = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        elif os.path.exists(path):
+            files = [path]
+        else:
+            state[path] = None
+            continue
+        for file_path in files:
+            if hash_files:
+                state[file_path] = _sha256(file_path)
+            else:
+                stat = os.stat(file_path)
+                state[file_path] = [stat.st_size, stat.st_mtime_ns]
+    return state
+
+
+def stage_fingerprint(stage, config, hash_inputs=False):
+    payload = {
+        "inputs": file_state(stage.inputs, hash_inputs),
+        "config": {key: config.get(key) for key in stage.config_keys},
+        "code": {module: _sha256(importlib.util.find_spec(module).origin) for module in stage.code},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def read_record(stage):
+    try:
+        with open(stage.record_path) as record_file:
+            return json.load(record_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def is_cached(stage, fingerprint):
+    record = read_record(stage)
+    if record is None or record["fingerprint"] != fingerprint:
+        return False
+    outputs = file_state(stage.outputs)
+    return all(state is not None for state in outputs.values()) and outputs == record["outputs"]
+
+
+def write_record(stage, fingerprint):
+    os.makedirs(STAGE_CACHE_DIR, exist_ok=True)
+    record = {"stage": stage.name, "fingerprint": fingerprint, "completed_at": datetime.now(timezone.utc).isoformat(),
+              "outputs": file_state(stage.outputs)}
+    staging = stage.record_path + ".tmp"
+    with open(staging, "w") as record_file:
+        json.dump(record, record_file, indent=2)
+    os.replace(staging, stage.record_path)
+
+
+def run_stage(stage, run, config, force=False, hash_inputs=False):
+    '''
+    stage : Stage : what the stage reads and writes
+    run : callable : runs the stage
+    force : bool : run even when cached
+
+    returns bool : True when the stage ran, False when it was skipped
+    '''
+    fingerprint = stage_fingerprint(stage, config, hash_inputs)
+    if not force and is_cached(stage, fingerprint):
+        logger.info(f"Stage {stage.name} is up to date ({fingerprint[:12]}), skipping.")
+        return False
+
+    # A run that fails part way must not leave the old record valid
+    if os.path.exists(stage.record_path):
+        os.remove(stage.record_path)
+    logger.info(f"Running stage {stage.name} ({fingerprint[:12]}{', forced' if force else ''}).")
+    run()
+    write_record(stage, fingerprint)
+    return True
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+from utils.array_store import save_array, load_array, staging_path
+
+
+def offsets_path(path):
+    return os.path.splitext(path)[0] + "_offsets.npy"
+
+
+def save_text(path, strings):
+    '''
+    path : str : .bin destination for the concatenated UTF-8 bytes
+    strings : iterable : str per row, None / NaN for a missing value
+
+    Writes the blob and an int64 offsets array (offsets_path) where row i is
+    blob[offsets[i]:offsets[i + 1]]. Missing values are stored empty.
+    '''
+    encoded = [value.encode("utf-8") if isinstance(value, str) else b"" for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    # Renamed into place like save_array, the old blob may be memory-mapped
+    staging = staging_path(path)
+    with open(staging, "wb") as blob_file:
+        blob_file.write(b"".join(encoded))
+    os.replace(staging, path)
+    save_array(offsets_path(path), offsets, rows=len(encoded), blob_bytes=int(offsets[-1]))
+
+
+class TextStore:
+    '''
+    Read-only, memory-mapped column of strings written by save_text. Only
+    the rows asked for are decoded, the rest of the blob stays on disk /
+    in the page cache.
+    '''
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, path):
+        offsets = load_array(offsets_path(path))
+        # np.memmap refuses empty files
+        blob = np.memmap(path, dtype=np.uint8, mode="r") if offsets[-1] else np.zeros(0, dtype=np.uint8)
+        if len(blob) != offsets[-1]:
+            raise ValueError(f"{path} holds {len(blob)} bytes, its offsets expect {offsets[-1]}")
+        return cls(blob, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, row, default=None):
+        '''
+        returns str : value of row, default when the row is out of range or empty
+        '''
+        if row is None or row < 0 or row >= len(self):
+            return default
+        start, end = self.offsets[row], self.offsets[row + 1]
+        if start == end:
+            return default
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def take(self, rows, default=None):
+        return [self.get(int(row), default) for row in rows]
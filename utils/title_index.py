@@ -0,0 +1,165 @@
+import re
+import bisect
+import difflib
+import unicodedata
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_title(name):
+    '''
+    Case, width and punctuation insensitive form of a title:
+    "Attack on Titan: Final Season" -> "attack on titan final season"
+    '''
+    name = unicodedata.normalize("NFKC", str(name)).casefold()
+    return _NON_WORD.sub(" ", name).strip()
+
+
+class TitleIndex:
+    '''
+    In-memory title lookups over the anime df (eng_version) and the synopsis
+    df (Name, usually the romanized title), built once per artifact load.
+
+      exact    MAL_ID -> row and normalized name -> rows, plain dicts
+      prefix   every word start of every normalized title in one sorted
+               array; a prefix is two bisects, so "tita" finds
+               "Attack on Titan" as well as "Titan Maximum", ranked over
+               the whole matching slice with argpartition
+      fuzzy    difflib similarity over the titles sharing the longest
+               prefix with the query, only when the prefix search comes
+               back short
+    '''
+
+    def __init__(self, anime_df, synopsis_df):
+        self.anime_ids = anime_df['MAL_ID'].to_numpy(dtype=np.int64)
+        self.names = anime_df['eng_version'].to_numpy()
+        members = anime_df['Members'] if 'Members' in anime_df else np.zeros(len(anime_df))
+        self.members = np.nan_to_num(np.asarray(members, dtype=np.float64))
+
+        self.row_by_id = {}
+        for row, anime_id in enumerate(self.anime_ids.tolist()):
+            self.row_by_id.setdefault(anime_id, row)
+
+        # Titles with neither an English name nor a Name show the synopsis
+        # Name, or are left out of the results (NaN is not valid JSON)
+        self.names = np.array([name if isinstance(name, str) else None for name in self.names], dtype=object)
+        for anime_id, name in zip(synopsis_df['MAL_ID'].tolist(), synopsis_df['Name'].tolist()):
+            row = self.row_by_id.get(anime_id)
+            if row is not None and self.names[row] is None and isinstance(name, str):
+                self.names[row] = name
+
+        # Every alias of a title, pointing at the anime df row it is shown as
+        aliases = [(name, row) for row, name in enumerate(self.names)]
+        for anime_id, name in zip(synopsis_df['MAL_ID'].tolist(), synopsis_df['Name'].tolist()):
+            if anime_id in self.row_by_id:
+                aliases.append((name, self.row_by_id[anime_id]))
+
+        self.rows_by_name = {}
+        keys = []
+        for name, row in aliases:
+            if not isinstance(name, str):
+                continue
+            normalized = normalize_title(name)
+            if not normalized:
+                continue
+            rows = self.rows_by_name.setdefault(normalized, [])
+            if row not in rows:
+                rows.append(row)
+            words = normalized.split(" ")
+            for start in range(len(words)):
+                # Whole-title prefixes rank before matches on a later word
+                keys.append((" ".join(words[start:]), start == 0, row))
+
+        keys.sort(key=lambda key: key[0])
+        self.keys = [key for key, _, _ in keys]
+        self.key_is_start = np.array([is_start for _, is_start, _ in keys], dtype=bool)
+        self.key_rows = np.array([row for _, _, row in keys], dtype=np.int32)
+        # One sort key per entry: whole-title matches above any later-word
+        # match, then by Members
+        self.key_rank = self.members[self.key_rows] + self.key_is_start * (self.members.max(initial=0) + 1)
+
+    def __len__(self):
+        return len(self.names)
+
+    def row_of_id(self, anime_id):
+        return self.row_by_id.get(int(anime_id))
+
+    def rows_of_name(self, name):
+        '''
+        returns list : anime df rows whose title or synopsis Name normalizes to name
+        '''
+        return self.rows_by_name.get(normalize_title(name), [])
+
+    def _key_range(self, prefix, max_scan=None):
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\U0010ffff")
+        return start, end if max_scan is None else min(end, start + max_scan)
+
+    def prefix(self, prefix, limit=10):
+        '''
+        prefix : str : what the user typed so far
+        limit : int : titles to return
+
+        returns list : anime df rows, whole-title matches first, then by Members
+        '''
+        prefix = normalize_title(prefix)
+        if not prefix:
+            return []
+        start, end = self._key_range(prefix)
+        rows = self.key_rows[start:end]
+        rank = -self.key_rank[start:end]
+
+        # Only the best entries are sorted; a title matched on several words
+        # takes several entries, so widen until limit distinct titles are in
+        take = limit * 4
+        while True:
+            if take >= len(rank):
+                best = np.argsort(rank, kind="stable")
+            else:
+                best = np.argpartition(rank, take)[:take]
+                best = best[np.argsort(rank[best], kind="stable")]
+            found = list(dict.fromkeys(rows[best].tolist()))
+            if len(found) >= limit or take >= len(rank):
+                return found[:limit]
+            take *= 4
+
+    def fuzzy(self, query, limit=10, cutoff=0.75, min_prefix=3, max_scan=1000):
+        '''
+        Typo tolerant matches: the titles sharing the longest prefix with
+        query (at least min_prefix characters) ranked by difflib similarity,
+        so the cost stays bounded however large the catalogue.
+
+        returns list : anime df rows
+        '''
+        query = normalize_title(query)
+        for cut in range(len(query) - 1, min_prefix - 1, -1):
+            start, end = self._key_range(query[:cut], max_scan)
+            if start == end:
+                continue
+            matcher = difflib.SequenceMatcher(b=query)
+            scored = []
+            for position in range(start, end):
+                matcher.set_seq1(self.keys[position][:len(query) + 2])
+                if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                    ratio = matcher.ratio()
+                    if ratio >= cutoff:
+                        row = int(self.key_rows[position])
+                        scored.append((-ratio, -self.members[row], row))
+            return list(dict.fromkeys(row for _, _, row in sorted(scored)))[:limit]
+        return []
+
+    def search(self, query, limit=10):
+        '''
+        Prefix matches, topped up with fuzzy matches when they come back short.
+
+        returns list : anime df rows
+        '''
+        rows = self.prefix(query, limit)
+        if len(rows) < limit:
+            rows.extend(row for row in self.fuzzy(query, limit) if row not in rows)
+        return rows[:limit]
+
+    def titles(self, rows):
+        return [{"anime_id": int(self.anime_ids[row]), "anime_name": self.names[row]}
+                for row in rows if self.names[row] is not None]
@@ -0,0 +1,70 @@
+import numpy as np
+from utils.quantization import similarity_scores
+
+
+def top_k(scores, k, largest=True):
+    '''
+    scores : np.ndarray : 1-D (n_items,) or 2-D (n_queries, n_items) scores
+    k : int : number of items to keep per query
+    largest : bool : keep the highest scores when True, the lowest otherwise
+
+    returns np.ndarray : indices of the selected items ordered best first
+    '''
+    scores = np.asarray(scores)
+    n_items = scores.shape[-1]
+    k = max(0, min(int(k), n_items))
+
+    if k == 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+
+    keyed = -scores if largest else scores
+
+    # Partial selection is O(N); only the k survivors get sorted
+    if k < n_items:
+        candidates = np.argpartition(keyed, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n_items), scores.shape).copy()
+
+    order = np.argsort(np.take_along_axis(keyed, candidates, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def similarity_top_k(weights, queries, k, largest=True):
+    '''
+    weights : np.ndarray | QuantizedTable : (n_items, dim) normalized embedding table
+    queries : np.ndarray : (dim,) or (n_queries, dim) query vectors
+    k : int : neighbours to return per query
+
+    Scores every query against the table with a single matrix product.
+
+    returns (indices, similarities) each shaped (n_queries, k), best first
+    '''
+    queries = np.atleast_2d(queries)
+    scores = similarity_scores(weights, queries)
+    indices = top_k(scores, k, largest=largest)
+    return indices, np.take_along_axis(scores, indices, axis=-1)
+
+
+def neighbour_table(weights, k, block_rows=1024):
+    '''
+    weights : np.ndarray : (n_items, dim) normalized embedding table
+    k : int : neighbours kept per item (the item itself is excluded)
+    block_rows : int : rows scored per matrix product, bounds scratch memory
+
+    returns (indices, similarities) each shaped (n_items, k), best first
+    '''
+    n_items = len(weights)
+    k = min(k, n_items - 1)
+    indices = np.empty((n_items, k), dtype=np.int32)
+    similarities = np.empty((n_items, k), dtype=np.float32)
+
+    for start in range(0, n_items, block_rows):
+        end = min(start + block_rows, n_items)
+        scores = similarity_scores(weights, weights[start:end])
+        rows = np.arange(end - start)
+        scores[rows, rows + start] = -np.inf
+        block_indices = top_k(scores, k)
+        indices[start:end] = block_indices
+        similarities[start:end] = np.take_along_axis(scores, block_indices, axis=-1)
+
+    return indices, similarities